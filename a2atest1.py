@@ -26,6 +26,7 @@ OPENAI_BASE_URL          - LLM 基础 URL
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import Dict, Any, Optional, List
 import asyncio
@@ -44,7 +45,7 @@ import shutil
 from pathlib import Path
 
 # 导入单 Agent SQL 优化组件
-from optimize_sql import SQLOptimizerSingle
+from optimize_sql import SQLOptimizerSingle, with_iso_timestamp
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -163,7 +164,7 @@ async def setup_ssh_config():
         return True
 
     except Exception as e:
-        logger.error(f"❌ SSH 配置初始化失败: {e}")
+        logger.error("❌ SSH 配置初始化失败: %s", e)
         ssh_configured = False
         return False
 
@@ -181,7 +182,7 @@ async def startup_event():
         sql_optimizer_instance = SQLOptimizerSingle()
         logger.info("✅ 单 Agent SQL 优化器初始化成功")
     except Exception as e:
-        logger.error(f"❌ 单 Agent SQL 优化器初始化失败: {e}")
+        logger.error("❌ 单 Agent SQL 优化器初始化失败: %s", e)
         sql_optimizer_instance = None
 
 @app.get("/")
@@ -242,34 +243,35 @@ async def optimize_sql_endpoint(request: SQLOptimizationRequest, background_task
     start_time = datetime.now()
 
     try:
-        logger.info(f"收到 SQL 优化请求: {request_id}")
+        logger.info("收到 SQL 优化请求: %s", request_id)
 
         # 单 Agent 执行完整优化分析
-        optimization_result = sql_optimizer_instance.optimize_sql(request.sql_query)
+        optimization_result = with_iso_timestamp(sql_optimizer_instance.optimize_sql(request.sql_query))
 
         # 单 Agent 已经包含完整的分析和优化，无需额外的审核步骤
         review_result = None
         final_status = "OPTIMIZED_BY_SINGLE_AGENT"
 
         # 计算处理时间
-        processing_time = (datetime.now() - start_time).total_seconds()
+        finished_at = datetime.now()
+        processing_time = (finished_at - start_time).total_seconds()
 
         response = SQLOptimizationResponse(
             request_id=request_id,
             status="success",
             message="SQL 优化完成 (单 Agent 综合分析)",
-            timestamp=datetime.now().isoformat(),
+            timestamp=finished_at.isoformat(),
             optimization_result=optimization_result,
             review_result=review_result,
             final_status=final_status,
             processing_time=processing_time
         )
 
-        logger.info(f"SQL 优化完成: {request_id}, 耗时: {processing_time:.2f}s")
+        logger.info("SQL 优化完成: %s, 耗时: %.2fs", request_id, processing_time)
         return response
 
     except Exception as e:
-        logger.error(f"SQL 优化失败: {request_id}, 错误: {str(e)}")
+        logger.error("SQL 优化失败: %s, 错误: %s", request_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"SQL 优化失败: {str(e)}"
@@ -292,13 +294,14 @@ async def optimize_sql_async(request: SQLOptimizationRequest, background_tasks:
     task_id = str(uuid.uuid4())
 
     # 创建任务状态
+    submitted_at = datetime.now().isoformat()
     task_status = TaskStatus(
         task_id=task_id,
         status="pending",
         message="任务已提交，等待单 Agent 处理",
         progress=0.0,
-        created_at=datetime.now().isoformat(),
-        updated_at=datetime.now().isoformat()
+        created_at=submitted_at,
+        updated_at=submitted_at
     )
     task_store[task_id] = task_status
 
@@ -309,7 +312,7 @@ async def optimize_sql_async(request: SQLOptimizationRequest, background_tasks:
         "task_id": task_id,
         "status": "submitted",
         "message": "优化任务已提交 (单 Agent 处理)",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": submitted_at
     }
 
 async def process_optimization_task_single_agent(task_id: str, request: SQLOptimizationRequest):
@@ -323,7 +326,7 @@ async def process_optimization_task_single_agent(task_id: str, request: SQLOptim
         task_status.updated_at = datetime.now().isoformat()
 
         # 单 Agent 执行完整优化分析
-        optimization_result = sql_optimizer_instance.optimize_sql(request.sql_query)
+        optimization_result = with_iso_timestamp(sql_optimizer_instance.optimize_sql(request.sql_query))
 
         # 更新为完成状态
         task_status.status = "completed"
@@ -337,7 +340,7 @@ async def process_optimization_task_single_agent(task_id: str, request: SQLOptim
         }
 
     except Exception as e:
-        logger.error(f"单 Agent 后台任务失败: {task_id}, 错误: {str(e)}")
+        logger.error("单 Agent 后台任务失败: %s, 错误: %s", task_id, e)
         # 更新为失败状态
         task_status = task_store[task_id]
         task_status.status = "failed"
@@ -390,8 +393,8 @@ def verify_gitlab_signature(payload_body: bytes, signature_header: str, token_he
                 return True
             else:
                 logger.error("❌ GitLab Token 验证失败")
-                logger.error(f"Expected: {expected_token}")
-                logger.error(f"Received: {token_header}")
+                logger.error("Expected: %s", expected_token)
+                logger.error("Received: %s", token_header)
                 return False
 
         # 2. X-Gitlab-Token header 验证
@@ -417,14 +420,14 @@ def verify_gitlab_signature(payload_body: bytes, signature_header: str, token_he
 
                     if not is_valid:
                         logger.error("❌ GitLab Webhook 签名验证失败")
-                        logger.error(f"Expected: sha256={expected_signature}")
-                        logger.error(f"Received: {signature_header}")
+                        logger.error("Expected: sha256=%s", expected_signature)
+                        logger.error("Received: %s", signature_header)
                     else:
                         logger.info("✅ GitLab Webhook 签名验证成功")
 
                     return is_valid
                 else:
-                    logger.error(f"❌ 不支持的哈希算法: {hash_algorithm}")
+                    logger.error("❌ 不支持的哈希算法: %s", hash_algorithm)
                     return False
             else:
                 logger.error("❌ GitLab 签名格式错误，应以 'sha256=' 开头")
@@ -435,25 +438,25 @@ def verify_gitlab_signature(payload_body: bytes, signature_header: str, token_he
         return True  # 测试环境下允许通过
 
     except Exception as e:
-        logger.error(f"❌ GitLab 签名验证过程中发生错误: {e}")
+        logger.error("❌ GitLab 签名验证过程中发生错误: %s", e)
         return False
 
 def extract_sql_files(commits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """从提交中提取 SQL 文件 (支持 GitLab webhook 格式)"""
     sql_files = []
 
-    logger.info(f"开始处理 {len(commits)} 个提交")
+    logger.info("开始处理 %s 个提交", len(commits))
 
     for commit in commits:
         # 检查 commit 是否为字典类型
         if not isinstance(commit, dict):
-            logger.error(f"Commit 不是字典类型: {type(commit)}")
+            logger.error("Commit 不是字典类型: %s", type(commit))
             continue
 
         commit_id = commit.get('id', '')
         commit_message = commit.get('message', '')
 
-        logger.info(f"处理 commit: {commit_id[:8]} - {commit_message[:50]}")
+        logger.info("处理 commit: %s - %s", commit_id[:8], commit_message[:50])
 
         # GitLab webhook 中文件变更信息
         # GitLab 使用 'added', 'modified', 'removed' 字段
@@ -461,7 +464,7 @@ def extract_sql_files(commits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         modified = commit.get('modified', [])
         removed = commit.get('removed', [])
 
-        logger.info(f"文件变更统计 - 新增: {len(added)}, 修改: {len(modified)}, 删除: {len(removed)}")
+        logger.info("文件变更统计 - 新增: %s, 修改: %s, 删除: %s", len(added), len(modified), len(removed))
 
         # 合并所有变更的文件
         all_changed_files = []
@@ -494,9 +497,9 @@ def extract_sql_files(commits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                     'commit_message': commit_message,
                     'action': file_info.get('action', 'modified')
                 })
-                logger.info(f"发现 SQL 文件: {file_path}")
+                logger.info("发现 SQL 文件: %s", file_path)
 
-    logger.info(f"总共发现 {len(sql_files)} 个 SQL 文件")
+    logger.info("总共发现 %s 个 SQL 文件", len(sql_files))
     return sql_files
 
 async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: str) -> Optional[str]:
@@ -517,7 +520,7 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
         default_key = Path.home() / ".ssh" / "id_rsa"
         if default_key.exists():
             ssh_command_parts.append(f"-i {default_key}")
-            logger.info(f"使用默认 SSH 密钥: {default_key}")
+            logger.info("使用默认 SSH 密钥: %s", default_key)
         else:
             logger.warning("未找到 SSH 密钥，使用默认 SSH 配置")
                 
@@ -533,7 +536,7 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
         if ssh_command_parts:
             ssh_command = f"ssh {' '.join(ssh_command_parts)}"
             env['GIT_SSH_COMMAND'] = ssh_command
-            logger.info(f"SSH 命令: {ssh_command}")
+            logger.info("SSH 命令: %s", ssh_command)
 
         # 设置 Git 用户信息
         env['GIT_AUTHOR_NAME'] = GITHUB_USER
@@ -543,8 +546,8 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
 
         repo_url = f"ssh://git@git.nd.com.cn:10022/data-tech/monitor/{repo_full_name}.git"
       
-        logger.info(f"尝试克隆仓库: {repo_url}")
-        logger.info(f"仓库完整名称: {repo_full_name}")
+        logger.info("尝试克隆仓库: %s", repo_url)
+        logger.info("仓库完整名称: %s", repo_full_name)
 
         # 使用临时目录，避免路径冲突
         import tempfile
@@ -552,7 +555,7 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
         
         temp_dir = tempfile.mkdtemp(prefix="git_clone_")
         clone_path = Path(temp_dir) / "repo"
-        logger.info(f"使用临时目录: {clone_path}")
+        logger.info("使用临时目录: %s", clone_path)
 
         try:
             # 克隆特定 commit
@@ -561,7 +564,7 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
                 '--no-checkout', repo_url, str(clone_path)
             ]
 
-            logger.info(f"执行克隆命令: {' '.join(clone_cmd)}")
+            logger.info("执行克隆命令: %s", ' '.join(clone_cmd))
             result = subprocess.run(
                 clone_cmd,
                 capture_output=True,
@@ -571,69 +574,61 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
             )
 
             if result.returncode != 0:
-                logger.error(f"Git 克隆失败: {result.stderr}")
-                logger.error(f"克隆命令输出: {result.stdout}")
+                logger.error("Git 克隆失败: %s", result.stderr)
+                logger.error("克隆命令输出: %s", result.stdout)
                 # 清理临时目录
                 shutil.rmtree(temp_dir, ignore_errors=True)
                 return None
 
             logger.info("仓库克隆成功")
 
-            # 切换到指定 commit 并检出文件
-            original_cwd = os.getcwd()
-            try:
-                os.chdir(clone_path)
-
-                # 检出特定 commit
-                checkout_cmd = ['git', 'checkout', commit_sha, '--', file_path]
-                logger.info(f"执行检出命令: {' '.join(checkout_cmd)}")
-
-                result = subprocess.run(
-                    checkout_cmd,
-                    capture_output=True,
-                    text=True,
-                    env=env,
-                    timeout=30
-                )
-
-                if result.returncode != 0:
-                    logger.error(f"Git 检出失败: {file_path}, 错误: {result.stderr}")
-                    return None
-
-                logger.info("文件检出成功")
-
-                # 读取文件内容
-                file_full_path = clone_path / file_path
-                if file_full_path.exists():
-                    content = file_full_path.read_text(encoding='utf-8', errors='ignore')
-                    logger.info(f"成功读取文件内容，长度: {len(content)} 字符")
-                    return content
-                else:
-                    logger.error(f"文件不存在: {file_path}")
-                    return None
+            # 在克隆目录中检出特定 commit 的文件（通过 cwd 指定目录，不修改进程工作目录）
+            checkout_cmd = ['git', 'checkout', commit_sha, '--', file_path]
+            logger.info("执行检出命令: %s", ' '.join(checkout_cmd))
+
+            result = subprocess.run(
+                checkout_cmd,
+                capture_output=True,
+                text=True,
+                env=env,
+                timeout=30,
+                cwd=clone_path
+            )
+
+            if result.returncode != 0:
+                logger.error("Git 检出失败: %s, 错误: %s", file_path, result.stderr)
+                return None
+
+            logger.info("文件检出成功")
+
+            # 读取文件内容
+            file_full_path = clone_path / file_path
+            if file_full_path.exists():
+                content = file_full_path.read_text(encoding='utf-8', errors='ignore')
+                logger.info("成功读取文件内容，长度: %s 字符", len(content))
+                return content
+            else:
+                logger.error("文件不存在: %s", file_path)
+                return None
 
-            finally:
-                # 恢复原始工作目录
-                os.chdir(original_cwd)
-                
         except subprocess.TimeoutExpired:
-            logger.error(f"Git 操作超时: {file_path}")
+            logger.error("Git 操作超时: %s", file_path)
             return None
         except Exception as e:
-            logger.error(f"通过 SSH 获取文件内容失败: {e}")
+            logger.error("通过 SSH 获取文件内容失败: %s", e)
             import traceback
-            logger.error(f"详细错误信息: {traceback.format_exc()}")
+            logger.error("详细错误信息: %s", traceback.format_exc())
             return None
         finally:
             # 清理临时目录
             try:
                 shutil.rmtree(temp_dir, ignore_errors=True)
-                logger.info(f"已清理临时目录: {temp_dir}")
+                logger.info("已清理临时目录: %s", temp_dir)
             except Exception as e:
-                logger.warning(f"清理临时目录失败: {e}")
+                logger.warning("清理临时目录失败: %s", e)
 
     except Exception as e:
-        logger.error(f"创建临时目录或克隆仓库失败: {e}")
+        logger.error("创建临时目录或克隆仓库失败: %s", e)
         return None
 
 async def post_github_comment(repo_full_name: str, commit_sha: str, comment: str) -> bool:
@@ -677,12 +672,10 @@ async def post_github_comment(repo_full_name: str, commit_sha: str, comment: str
         )
 
         if result.returncode != 0:
-            logger.error(f"Git 克隆失败: {result.stderr}")
+            logger.error("Git 克隆失败: %s", result.stderr)
             return False
 
-        os.chdir(clone_path)
-
-        # 创建带评论的 tag 作为备选方案
+        # 创建带评论的 tag 作为备选方案（git 命令通过 cwd 在克隆目录中执行）
         tag_name = f"sql-review-{commit_sha[:8]}"
         tag_message = f"SQL 优化审核报告\n\n{comment[:500]}"  # 限制长度
 
@@ -693,11 +686,12 @@ async def post_github_comment(repo_full_name: str, commit_sha: str, comment: str
             capture_output=True,
             text=True,
             env=env,
-            timeout=30
+            timeout=30,
+            cwd=clone_path
         )
 
         if result.returncode != 0:
-            logger.error(f"Git tag 创建失败: {result.stderr}")
+            logger.error("Git tag 创建失败: %s", result.stderr)
             return False
 
         # 推送 tag
@@ -707,21 +701,22 @@ async def post_github_comment(repo_full_name: str, commit_sha: str, comment: str
             capture_output=True,
             text=True,
             env=env,
-            timeout=30
+            timeout=30,
+            cwd=clone_path
         )
 
         if result.returncode == 0:
-            logger.info(f"✅ 通过 SSH 创建评论 tag: {tag_name}")
+            logger.info("✅ 通过 SSH 创建评论 tag: %s", tag_name)
             return True
         else:
-            logger.error(f"Git push 失败: {result.stderr}")
+            logger.error("Git push 失败: %s", result.stderr)
             return False
 
     except subprocess.TimeoutExpired:
         logger.error("Git 操作超时")
         return False
     except Exception as e:
-        logger.error(f"SSH 方式发布评论失败: {e}")
+        logger.error("SSH 方式发布评论失败: %s", e)
         return False
 
 def format_review_comment(reviews: List[SQLReviewResult]) -> str:
@@ -814,8 +809,8 @@ async def gitlab_webhook(
         x_gitlab_event = headers.get("x-gitlab-event") or headers.get("X-Gitlab-Event")
         x_gitlab_signature = headers.get("x-gitlab-signature") or headers.get("X-Gitlab-Signature")
 
-        logger.info(f"收到 GitLab webhook 请求，事件: {x_gitlab_event}")
-        logger.info(f"Token: {x_gitlab_token is not None}, Signature: {x_gitlab_signature is not None}")
+        logger.info("收到 GitLab webhook 请求，事件: %s", x_gitlab_event)
+        logger.info("Token: %s, Signature: %s", x_gitlab_token is not None, x_gitlab_signature is not None)
 
         # 验证签名或token
         if not verify_gitlab_signature(payload_body, x_gitlab_signature, x_gitlab_token):
@@ -824,7 +819,7 @@ async def gitlab_webhook(
 
         # 只处理 push 事件
         if x_gitlab_event != "Push Hook":
-            logger.info(f"忽略非 push 事件: {x_gitlab_event}")
+            logger.info("忽略非 push 事件: %s", x_gitlab_event)
             return WebhookResponse(
                 webhook_id=webhook_id,
                 status="ignored",
@@ -836,21 +831,21 @@ async def gitlab_webhook(
         # 解析 payload
         try:
             payload = json.loads(payload_body)
-            logger.info(f"Payload type: {type(payload)}")
-            logger.info(f"Payload keys: {payload.keys() if isinstance(payload, dict) else 'Not a dict'}")
+            logger.info("Payload type: %s", type(payload))
+            logger.info("Payload keys: %s", (payload.keys() if isinstance(payload, dict) else 'Not a dict'))
         except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析失败: {e}")
-            logger.error(f"Payload body: {payload_body[:500]}...")  # 显示前500个字符
+            logger.error("JSON 解析失败: %s", e)
+            logger.error("Payload body: %s...", payload_body[:500])  # 显示前500个字符
             raise
 
         # 提取 GitLab 特有信息
         if not isinstance(payload, dict):
-            logger.error(f"Payload 不是字典类型: {type(payload)}")
+            logger.error("Payload 不是字典类型: %s", type(payload))
             raise HTTPException(status_code=400, detail="无效的 webhook payload 格式")
 
         project = payload.get('project', {})
         if not isinstance(project, dict):
-            logger.error(f"Project 字段不是字典类型: {type(project)}")
+            logger.error("Project 字段不是字典类型: %s", type(project))
             project = {}
 
         repo_name = project.get('name', '')  # GitLab 项目名称
@@ -864,7 +859,7 @@ async def gitlab_webhook(
         # GitLab 的 commits 结构与 GitHub 略有不同
         commits = payload.get('commits', [])
         if not isinstance(commits, list):
-            logger.error(f"Commits 字段不是列表类型: {type(commits)}")
+            logger.error("Commits 字段不是列表类型: %s", type(commits))
             commits = []
 
         if not commits:
@@ -893,7 +888,7 @@ async def gitlab_webhook(
                 sql_files_found=0
             )
 
-        logger.info(f"发现 {len(sql_files)} 个 SQL 文件需要审核")
+        logger.info("发现 %s 个 SQL 文件需要审核", len(sql_files))
 
         # 提交后台任务进行审核
         background_tasks.add_task(
@@ -923,7 +918,7 @@ async def gitlab_webhook(
         logger.error("无法解析 JSON payload")
         raise HTTPException(status_code=400, detail="无效的 JSON payload")
     except Exception as e:
-        logger.error(f"处理 GitLab webhook 失败: {e}")
+        logger.error("处理 GitLab webhook 失败: %s", e)
         raise HTTPException(status_code=500, detail=f"处理 webhook 失败: {str(e)}")
 
 # 保留 GitHub webhook 端点作为备用，但重定向到 GitLab 处理
@@ -940,7 +935,7 @@ async def process_sql_reviews_single_agent(webhook_id: str, repo_full_name: str,
 
         for sql_file in sql_files:
             file_path = sql_file['file_path']
-            logger.info(f"单 Agent 审核文件: {file_path}")
+            logger.info("单 Agent 审核文件: %s", file_path)
 
             # 获取文件内容
             sql_content = await fetch_file_content(repo_full_name, file_path, commit_sha)
@@ -990,7 +985,7 @@ async def process_sql_reviews_single_agent(webhook_id: str, repo_full_name: str,
                     ))
 
             except Exception as e:
-                logger.error(f"单 Agent 审核文件 {file_path} 失败: {e}")
+                logger.error("单 Agent 审核文件 %s 失败: %s", file_path, e)
                 reviews.append(SQLReviewResult(
                     file_path=file_path,
                     status="error",
@@ -1008,10 +1003,10 @@ async def process_sql_reviews_single_agent(webhook_id: str, repo_full_name: str,
         comment = format_review_comment(reviews)
         await post_github_comment(repo_full_name, commit_sha, comment)
 
-        logger.info(f"单 Agent Webhook {webhook_id} 处理完成")
+        logger.info("单 Agent Webhook %s 处理完成", webhook_id)
 
     except Exception as e:
-        logger.error(f"单 Agent 处理 SQL 审核失败: {e}")
+        logger.error("单 Agent 处理 SQL 审核失败: %s", e)
         if webhook_id in webhook_history:
             webhook_history[webhook_id].status = "failed"
             webhook_history[webhook_id].message = f"单 Agent 处理失败: {str(e)}"
@@ -1053,10 +1048,10 @@ async def batch_optimize_sql(requests: List[SQLOptimizationRequest]):
 
     for i, request in enumerate(requests):
         try:
-            logger.info(f"单 Agent 处理批量优化 {i+1}/{len(requests)}")
+            logger.info("单 Agent 处理批量优化 %s/%s", i+1, len(requests))
 
             # 单 Agent 执行完整优化分析
-            optimization_result = sql_optimizer_instance.optimize_sql(request.sql_query)
+            optimization_result = with_iso_timestamp(sql_optimizer_instance.optimize_sql(request.sql_query))
             review_result = None  # 单 Agent 已包含综合分析
             final_status = "OPTIMIZED_BY_SINGLE_AGENT"
 
@@ -1069,14 +1064,15 @@ async def batch_optimize_sql(requests: List[SQLOptimizationRequest]):
             })
 
         except Exception as e:
-            logger.error(f"单 Agent 批量优化第 {i+1} 个失败: {str(e)}")
+            logger.error("单 Agent 批量优化第 %s 个失败: %s", i+1, e)
             results.append({
                 "index": i,
                 "status": "failed",
                 "error": str(e)
             })
 
-    processing_time = (datetime.now() - start_time).total_seconds()
+    finished_at = datetime.now()
+    processing_time = (finished_at - start_time).total_seconds()
 
     return {
         "batch_id": str(uuid.uuid4()),
@@ -1085,16 +1081,17 @@ async def batch_optimize_sql(requests: List[SQLOptimizationRequest]):
         "failed": sum(1 for r in results if r["status"] == "failed"),
         "processing_time": processing_time,
         "results": results,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": finished_at.isoformat()
     }
 
 # 错误处理
 @app.exception_handler(Exception)
-async def global_exception_handler(request, exc):
-    logger.error(f"全局异常: {str(exc)}")
-    return HTTPException(
+async def global_exception_handler(request: Request, exc: Exception):
+    """未处理异常统一返回 500 JSON 响应（异常处理器必须返回 Response 对象）"""
+    logger.exception("全局异常: %s", exc)
+    return JSONResponse(
         status_code=500,
-        detail=f"服务器内部错误: {str(exc)}"
+        content={"detail": f"服务器内部错误: {exc}"}
     )
 
 # 启动命令提示
@@ -3,7 +3,7 @@ FastAPI 服务：SQL 优化审核系统 API (单 Agent + SSH 架构)
 基于单 Agent 架构和 SSH 认证的 SQL 优化和审核功能
 
 启动服务:
-uvicorn fastapi_service:app --host 0.0.0.0 --port 8000 --reload
+uvicorn fastapi_service:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools
 
 API 文档:
 http://localhost:8000/docs
@@ -20,14 +20,25 @@ GITHUB_SSH_KEY_CONTENT   - SSH 私钥内容 (可选)
 GITHUB_USER              - Git 用户名
 GITHUB_EMAIL             - Git 邮箱地址
 GITHUB_WEBHOOK_SECRET    - Webhook 密钥
+GITLAB_TOKEN             - GitLab API 访问令牌 (可选，用于直接读取单个文件)
+GITLAB_API_URL           - GitLab API 地址 (可选)
 OPENAI_API_KEY           - LLM API 密钥
 OPENAI_BASE_URL          - LLM 基础 URL
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+
+# 安装了 orjson 时使用 orjson 解析请求、ORJSONResponse 序列化响应，否则使用标准库 json / JSONResponse
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultResponseClass
+except ImportError:
+    orjson = None
+    from fastapi.responses import JSONResponse as DefaultResponseClass
+from pydantic import BaseModel, Field, field_validator
 from typing import Dict, Any, Optional, List
+from collections import Counter, OrderedDict
 import asyncio
 import json
 import logging
@@ -39,24 +50,94 @@ import httpx
 import os
 import re
 import subprocess
+import time
 import tempfile
 import shutil
+import socket
+import traceback
+from itertools import islice
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from urllib.parse import quote
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
 
 # 导入单 Agent SQL 优化组件
-from optimize_sql import SQLOptimizerSingle
+from optimize_sql import SQLOptimizerSingle, sql_analyzer, with_iso_timestamp
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时初始化单 Agent SQL 优化器和 SSH 配置（结果保存在 app.state），关闭时停止队列消费者"""
+    # 专用默认线程池：asyncio.to_thread 执行的同步优化调用都在此运行，线程数可配置
+    optimizer_executor = ThreadPoolExecutor(max_workers=OPTIMIZER_THREADS, thread_name_prefix="sql-optimizer")
+    asyncio.get_running_loop().set_default_executor(optimizer_executor)
+    logger.info("✅ 优化器线程池: %s 个线程", OPTIMIZER_THREADS)
+
+    try:
+        # 初始化 SSH 配置
+        app.state.ssh_configured = await setup_ssh_config()
+
+        # 初始化单 Agent SQL 优化器
+        logger.info("正在初始化单 Agent SQL 优化器...")
+        app.state.optimizer = SQLOptimizerSingle()
+        logger.info("✅ 单 Agent SQL 优化器初始化成功")
+
+        # 在线程中预热 LLM 客户端（阻塞的导入/初始化不占用事件循环）
+        if await asyncio.to_thread(app.state.optimizer.warm_up):
+            logger.info("✅ CrewAI LLM 模式已预热")
+
+        # 启动 Redis 任务队列消费者
+        if isinstance(task_store, RedisTaskStore):
+            consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+            for i in range(OPTIMIZE_QUEUE_WORKERS):
+                queue_worker_tasks.append(
+                    asyncio.create_task(optimization_queue_worker(f"{consumer_prefix}-{i}"))
+                )
+            logger.info("✅ 已启动 %s 个优化任务队列消费者", OPTIMIZE_QUEUE_WORKERS)
+
+            # 启动任务提交批量写入协程
+            app.state.submit_queue = asyncio.Queue()
+            queue_worker_tasks.append(asyncio.create_task(optimization_submit_writer(app.state.submit_queue)))
+    except Exception as e:
+        logger.error("❌ 单 Agent SQL 优化器初始化失败: %s", e)
+        app.state.optimizer = None
+
+    yield
+
+    # 等待已提交的任务写入 Redis 后再停止队列消费者
+    if app.state.submit_queue is not None:
+        try:
+            await asyncio.wait_for(app.state.submit_queue.join(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ 仍有 %s 个优化任务未写入 Redis", app.state.submit_queue.qsize())
+    for worker_task in queue_worker_tasks:
+        worker_task.cancel()
+    queue_worker_tasks.clear()
+
+    # 关闭 GitLab API 客户端连接池
+    if get_gitlab_client.cache_info().currsize:
+        await get_gitlab_client().aclose()
+
+    optimizer_executor.shutdown(wait=False, cancel_futures=True)
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="SQL 优化审核系统 API",
     description="基于单 Agent 架构的 SQL 优化和审核服务",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=DefaultResponseClass,
+    lifespan=lifespan
 )
 
 # 添加 CORS 中间件
@@ -68,8 +149,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局变量存储 SQL 优化器实例
-sql_optimizer_instance = None
+# 应用状态：SQL 优化器实例与 SSH 配置状态（启动完成前为默认值）
+app.state.optimizer = None
+app.state.ssh_configured = False
+app.state.submit_queue = None
 
 # Pydantic 模型定义
 class SQLOptimizationRequest(BaseModel):
@@ -77,6 +160,16 @@ class SQLOptimizationRequest(BaseModel):
     sql_query: str = Field(..., description="要优化的 SQL 查询语句", min_length=10, max_length=10000)
     optimization_level: Optional[str] = Field("standard", description="优化级别", pattern="^(basic|standard|aggressive)$")
     include_review: Optional[bool] = Field(True, description="是否包含审核步骤")
+    force_refresh: bool = Field(False, description="忽略已缓存的优化结果，重新执行优化")
+
+    @field_validator("sql_query", mode="before")
+    @classmethod
+    def normalize_sql_query(cls, value: Any) -> Any:
+        """去除首尾空白并统一换行符，长度限制作用于规范化后的 SQL，缓存键也随之稳定"""
+        # 不折叠内部空白：会改变字符串字面量，且换行被折叠后 -- 注释会吞掉后续语句
+        if isinstance(value, str):
+            return value.strip().replace("\r\n", "\n")
+        return value
 
 class SQLOptimizationResponse(BaseModel):
     """SQL 优化响应模型"""
@@ -128,11 +221,137 @@ class WebhookResponse(BaseModel):
     sql_files_found: int
     reviews: Optional[List[SQLReviewResult]] = None
 
-# 内存存储任务状态（生产环境应使用 Redis）
-task_store: Dict[str, TaskStatus] = {}
+# 任务状态存储：默认进程内存储；设置 REDIS_URL 后使用 Redis（多实例共享、自动过期）
+REDIS_URL = os.getenv("REDIS_URL", "")
+TASK_TTL_SECONDS = int(os.getenv("TASK_TTL_SECONDS", "86400"))
+TASK_STORE_SIZE = int(os.getenv("TASK_STORE_SIZE", "10000"))  # 进程内存储最多保留的任务数
+
+class MemoryTaskStore:
+    """进程内任务状态存储（有界：与 Redis 存储一致，写入时刷新过期时间，超过上限或过期时淘汰最早写入的任务）"""
+
+    def __init__(self, max_size: int = TASK_STORE_SIZE, ttl_seconds: int = TASK_TTL_SECONDS):
+        self._tasks: "OrderedDict[str, TaskStatus]" = OrderedDict()
+        self._written_at: Dict[str, float] = {}
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+    def _prune(self) -> None:
+        """淘汰过期任务（任务按最近写入顺序排列，只需检查队首）"""
+        expire_before = time.monotonic() - self.ttl_seconds
+        while self._tasks:
+            oldest_id = next(iter(self._tasks))
+            if self._written_at[oldest_id] > expire_before:
+                break
+            self._tasks.popitem(last=False)
+            del self._written_at[oldest_id]
+
+    async def get(self, task_id: str) -> Optional[TaskStatus]:
+        self._prune()
+        return self._tasks.get(task_id)
+
+    async def set(self, task_status: TaskStatus) -> None:
+        task_id = task_status.task_id
+        self._tasks[task_id] = task_status
+        self._tasks.move_to_end(task_id)
+        self._written_at[task_id] = time.monotonic()
+        while len(self._tasks) > self.max_size:
+            oldest_id, _ = self._tasks.popitem(last=False)
+            del self._written_at[oldest_id]
+        self._prune()
+
+    async def delete(self, task_id: str) -> bool:
+        self._written_at.pop(task_id, None)
+        return self._tasks.pop(task_id, None) is not None
+
+    async def count(self) -> int:
+        self._prune()
+        return len(self._tasks)
+
+    async def list(self, offset: int = 0, limit: Optional[int] = None) -> List[TaskStatus]:
+        self._prune()
+        stop = None if limit is None else offset + limit
+        return list(islice(self._tasks.values(), offset, stop))
+
+class RedisTaskStore:
+    """
+    Redis 任务状态存储，键为 task:{task_id}，写入时刷新过期时间
+
+    任务 ID 另记入按最近写入时间排序的有序集合索引，列表查询无需 SCAN 全库；
+    写入与计数时按 TTL 清除索引中已过期的 ID，索引大小与存活任务数一致
+    """
+
+    key_prefix = "task:"
+    index_key = "tasks:updated_at"
+
+    def __init__(self, redis_url: str, ttl_seconds: int = TASK_TTL_SECONDS):
+        self.redis = redis_asyncio.from_url(redis_url, decode_responses=True)
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, task_id: str) -> Optional[TaskStatus]:
+        data = await self.redis.get(self.key_prefix + task_id)
+        return TaskStatus.model_validate_json(data) if data else None
+
+    async def set(self, task_status: TaskStatus) -> None:
+        now = time.time()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(
+                self.key_prefix + task_status.task_id,
+                task_status.model_dump_json(exclude_none=True),
+                ex=self.ttl_seconds
+            )
+            pipe.zadd(self.index_key, {task_status.task_id: now})
+            pipe.zremrangebyscore(self.index_key, "-inf", now - self.ttl_seconds)
+            await pipe.execute()
+
+    async def delete(self, task_id: str) -> bool:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(self.key_prefix + task_id)
+            pipe.zrem(self.index_key, task_id)
+            deleted, _ = await pipe.execute()
+        return deleted > 0
+
+    async def count(self) -> int:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.index_key, "-inf", time.time() - self.ttl_seconds)
+            pipe.zcard(self.index_key)
+            _, total = await pipe.execute()
+        return total
+
+    async def list(self, offset: int = 0, limit: Optional[int] = None) -> List[TaskStatus]:
+        stop = -1 if limit is None else offset + limit - 1
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.index_key, "-inf", time.time() - self.ttl_seconds)
+            pipe.zrange(self.index_key, offset, stop)
+            _, task_ids = await pipe.execute()
+        if not task_ids:
+            return []
+        values = await self.redis.mget([self.key_prefix + task_id for task_id in task_ids])
+        return [TaskStatus.model_validate_json(data) for data in values if data]
+
+def create_task_store():
+    """根据配置创建任务状态存储"""
+    if REDIS_URL:
+        if redis_asyncio is not None:
+            logger.info("任务状态存储: Redis")
+            return RedisTaskStore(REDIS_URL)
+        logger.warning("已设置 REDIS_URL 但未安装 redis，任务状态使用进程内存储")
+    return MemoryTaskStore()
+
+task_store = create_task_store()
+
+# 异步优化任务队列（Redis Stream，仅在使用 Redis 存储时启用，否则使用 BackgroundTasks）
+OPTIMIZE_STREAM = os.getenv("OPTIMIZE_STREAM", "sql:optimize")
+OPTIMIZE_CONSUMER_GROUP = os.getenv("OPTIMIZE_CONSUMER_GROUP", "sql-optimizer")
+OPTIMIZE_QUEUE_WORKERS = int(os.getenv("OPTIMIZE_QUEUE_WORKERS", "1"))
+OPTIMIZE_CLAIM_IDLE_MS = int(os.getenv("OPTIMIZE_CLAIM_IDLE_MS", "600000"))  # 超过该时长未确认的消息视为消费者已崩溃
+OPTIMIZE_SUBMIT_BATCH_SIZE = int(os.getenv("OPTIMIZE_SUBMIT_BATCH_SIZE", "128"))  # 单次 pipeline 最多写入的任务数
+OPTIMIZE_SUBMIT_RETRIES = int(os.getenv("OPTIMIZE_SUBMIT_RETRIES", "3"))  # 批量写入失败时的最大尝试次数
+queue_worker_tasks: List[asyncio.Task] = []
 
 # GitHub webhook 配置（从环境变量读取）
 GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+# 预先完成密钥编码，验证时直接使用
+WEBHOOK_SECRET_BYTES = GITHUB_WEBHOOK_SECRET.encode('utf-8')
 # SSH 配置
 GITHUB_SSH_KEY_PATH = os.getenv("GITHUB_SSH_KEY_PATH", "")  # SSH 私钥文件路径
 GITHUB_SSH_KEY_CONTENT = os.getenv("GITHUB_SSH_KEY_CONTENT", "")  # SSH 私钥内容（可选，优先使用文件路径）
@@ -140,15 +359,112 @@ GITHUB_KNOWN_HOSTS_PATH = os.getenv("GITHUB_KNOWN_HOSTS_PATH", "/tmp/known_hosts
 GITHUB_USER = os.getenv("GITHUB_USER", "git")  # Git 用户名
 GITHUB_EMAIL = os.getenv("GITHUB_EMAIL", "")  # Git 邮箱（用于 commit 签名）
 
-# 存储 webhook 处理历史
-webhook_history: Dict[str, WebhookResponse] = {}
-
-# SSH 配置全局变量
-ssh_configured = False
+# GitLab API 配置（设置 GITLAB_TOKEN 后直接通过 REST API 读取单个文件，无需克隆仓库）
+GITLAB_API_URL = os.getenv("GITLAB_API_URL", "https://git.nd.com.cn/api/v4")
+GITLAB_TOKEN = os.getenv("GITLAB_TOKEN", "")
+GITLAB_PROJECT_NAMESPACE = "data-tech/monitor"
+
+# 发布评论 tag 使用的持久化仓库目录（每个仓库只克隆一次，之后仅增量 fetch），按仓库加锁串行操作
+GIT_WORK_ROOT = Path(os.getenv("GIT_WORK_ROOT", str(Path(tempfile.gettempdir()) / "sql_review_repos")))
+repo_locks: Dict[str, asyncio.Lock] = {}
+GIT_GC_INTERVAL = int(os.getenv("GIT_GC_INTERVAL", "50"))  # 每个本地仓库每发布多少次评论执行一次 git gc
+repo_comment_counts: Counter = Counter()
+
+# 存储 webhook 处理历史（有界，超过上限或超过保留时长时淘汰最早的记录）
+WEBHOOK_HISTORY_SIZE = int(os.getenv("WEBHOOK_HISTORY_SIZE", "500"))
+WEBHOOK_HISTORY_TTL = int(os.getenv("WEBHOOK_HISTORY_TTL", "86400"))
+webhook_history: "OrderedDict[str, WebhookResponse]" = OrderedDict()
+webhook_recorded_at: Dict[str, float] = {}
+
+def prune_webhook_history() -> None:
+    """淘汰超出保留时长的 webhook 记录（记录按写入顺序排列，只需检查队首）"""
+    expire_before = time.monotonic() - WEBHOOK_HISTORY_TTL
+    while webhook_history:
+        oldest_id = next(iter(webhook_history))
+        if webhook_recorded_at[oldest_id] > expire_before:
+            break
+        webhook_history.popitem(last=False)
+        del webhook_recorded_at[oldest_id]
+
+def record_webhook(webhook_id: str, response: WebhookResponse) -> None:
+    """保存 webhook 处理记录"""
+    webhook_history[webhook_id] = response
+    webhook_recorded_at[webhook_id] = time.monotonic()
+    while len(webhook_history) > WEBHOOK_HISTORY_SIZE:
+        oldest_id, _ = webhook_history.popitem(last=False)
+        del webhook_recorded_at[oldest_id]
+    prune_webhook_history()
+
+# 秒级 ISO 时间戳缓存 (秒, 格式化结果)，同一秒内的响应复用已格式化的字符串
+_now_iso_cache = (0, "")
+
+def now_iso() -> str:
+    """当前时间的 ISO 字符串（秒级精度）；任务状态等需要更高精度的地方仍使用 datetime.now()"""
+    global _now_iso_cache
+    second = int(time.time())
+    cached_second, cached_text = _now_iso_cache
+    if second != cached_second:
+        cached_text = datetime.fromtimestamp(second).isoformat()
+        _now_iso_cache = (second, cached_text)
+    return cached_text
+
+# Webhook 审核时同时执行的 SQL 优化调用数上限
+SQL_REVIEW_CONCURRENCY = int(os.getenv("SQL_REVIEW_CONCURRENCY", "5"))
+
+# 批量优化接口同时执行的 SQL 优化调用数上限
+BATCH_OPTIMIZE_CONCURRENCY = int(os.getenv("BATCH_OPTIMIZE_CONCURRENCY", "5"))
+
+# 同步优化调用 (asyncio.to_thread) 使用的线程数，默认不低于 CPU 核数与批量并发上限
+OPTIMIZER_THREADS = int(os.getenv("OPTIMIZER_THREADS", str(max(os.cpu_count() or 1, BATCH_OPTIMIZE_CONCURRENCY))))
+
+# 审核严重程度关键字（忽略大小写匹配，无需生成小写副本）
+CRITICAL_SEVERITY_PATTERN = re.compile(r'critical|严重|error', re.IGNORECASE)
+HIGH_SEVERITY_PATTERN = re.compile(r'warning|警告|high', re.IGNORECASE)
+
+# SQL 优化结果缓存（相同 SQL + 优化级别直接复用结果，跳过 LLM 调用）
+OPTIMIZATION_CACHE_SIZE = int(os.getenv("OPTIMIZATION_CACHE_SIZE", "256"))
+optimization_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+def get_optimization_cache_key(sql_query: str, optimization_level: str) -> str:
+    """生成优化结果缓存键"""
+    return hashlib.blake2b(f"{optimization_level}\0{sql_query}".encode(), digest_size=16).hexdigest()
+
+async def optimize_sql_cached(sql_query: str, optimization_level: str = "standard", force_refresh: bool = False) -> Dict[str, Any]:
+    """带结果缓存的 SQL 优化（LRU 淘汰），未命中或 force_refresh 时在线程池中执行优化器并刷新缓存"""
+    start_time = time.perf_counter()
+    cache_key = get_optimization_cache_key(sql_query, optimization_level)
+    cached_result = None if force_refresh else optimization_cache.get(cache_key)
+    if cached_result is not None:
+        optimization_cache.move_to_end(cache_key)
+        logger.info("SQL 优化结果缓存命中: %s", cache_key)
+        # 缓存中的时间戳、耗时与缓存统计属于首次调用，命中时在副本上刷新为本次调用的值
+        return {
+            **cached_result,
+            "timestamp": datetime.now().isoformat(),
+            "processing_time": time.perf_counter() - start_time,
+            "cache_stats": sql_analyzer.get_cache_stats()
+        }
 
-async def setup_ssh_config():
-    """设置 SSH 配置"""
-    global ssh_configured
+    optimization_result = await asyncio.to_thread(app.state.optimizer.optimize_sql, sql_query)
+
+    # LLM 不可用或执行出错时优化器回退为本地分析的降级结果 (不带 agent 字段)，不缓存，下次请求重新尝试 LLM
+    if optimization_result.get("processing_mode") == "llm" or optimization_result.get("agent") == "fast_sql_optimizer":
+        optimization_cache[cache_key] = optimization_result
+        if len(optimization_cache) > OPTIMIZATION_CACHE_SIZE:
+            optimization_cache.popitem(last=False)
+    # 优化器记录 epoch 秒，对外与响应顶层 timestamp 一样使用 ISO 字符串
+    return with_iso_timestamp(optimization_result)
+
+# 审核评论中各严重程度对应的图标
+SEVERITY_EMOJI = {
+    'critical': '🚨',
+    'high': '⚠️',
+    'medium': '💡',
+    'low': '✅'
+}
+
+async def setup_ssh_config() -> bool:
+    """设置 SSH 配置，返回是否配置成功"""
     try:
         # 检查 SSH 密钥配置
         ssh_key_path = GITHUB_SSH_KEY_PATH or ""
@@ -158,32 +474,13 @@ async def setup_ssh_config():
             logger.warning("❌ 未配置 GitHub SSH 密钥，请设置 GITHUB_SSH_KEY_PATH 或 GITHUB_SSH_KEY_CONTENT 环境变量")
             return False
 
-        ssh_configured = True
         logger.info("✅ SSH 配置初始化成功")
         return True
 
     except Exception as e:
-        logger.error(f"❌ SSH 配置初始化失败: {e}")
-        ssh_configured = False
+        logger.error("❌ SSH 配置初始化失败: %s", e)
         return False
 
-# 启动时初始化
-@app.on_event("startup")
-async def startup_event():
-    """应用启动时初始化单 Agent SQL 优化器和 SSH 配置"""
-    global sql_optimizer_instance
-    try:
-        # 初始化 SSH 配置
-        await setup_ssh_config()
-
-        # 初始化单 Agent SQL 优化器
-        logger.info("正在初始化单 Agent SQL 优化器...")
-        sql_optimizer_instance = SQLOptimizerSingle()
-        logger.info("✅ 单 Agent SQL 优化器初始化成功")
-    except Exception as e:
-        logger.error(f"❌ 单 Agent SQL 优化器初始化失败: {e}")
-        sql_optimizer_instance = None
-
 @app.get("/")
 async def root():
     """根路径"""
@@ -192,7 +489,7 @@ async def root():
         "version": "2.0.0",
         "status": "running",
         "architecture": "single_agent",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now_iso(),
         "endpoints": {
             "optimize_sql": "/api/optimize",
             "task_status": "/api/task/{task_id}",
@@ -206,10 +503,10 @@ async def health_check():
     """健康检查"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "sql_optimizer": "initialized" if sql_optimizer_instance else "not_initialized",
+        "timestamp": now_iso(),
+        "sql_optimizer": "initialized" if app.state.optimizer else "not_initialized",
         "architecture": "single_agent",
-        "ssh_configured": ssh_configured,
+        "ssh_configured": app.state.ssh_configured,
         "github_auth_method": get_github_auth_method()
     }
 
@@ -217,12 +514,12 @@ def get_github_auth_method() -> str:
     """获取 GitHub 认证方法"""
     if os.getenv("GITHUB_TOKEN"):
         return "token"
-    elif ssh_configured:
+    elif app.state.ssh_configured:
         return "ssh"
     else:
         return "not_configured"
 
-@app.post("/api/optimize", response_model=SQLOptimizationResponse)
+@app.post("/api/optimize", response_model=None, responses={200: {"model": SQLOptimizationResponse}})
 async def optimize_sql_endpoint(request: SQLOptimizationRequest, background_tasks: BackgroundTasks):
     """
     优化 SQL 查询 (单 Agent 架构)
@@ -231,7 +528,7 @@ async def optimize_sql_endpoint(request: SQLOptimizationRequest, background_task
     - **optimization_level**: 优化级别 (basic/standard/aggressive) - 当前版本忽略，使用统一优化策略
     - **include_review**: 是否包含审核步骤 - 当前版本单 Agent 已包含综合分析
     """
-    if not sql_optimizer_instance:
+    if not app.state.optimizer:
         raise HTTPException(
             status_code=503,
             detail="SQL 优化器未初始化，服务暂时不可用"
@@ -239,37 +536,52 @@ async def optimize_sql_endpoint(request: SQLOptimizationRequest, background_task
 
     # 生成请求 ID
     request_id = str(uuid.uuid4())
-    start_time = datetime.now()
+    start_time = time.perf_counter()
 
     try:
-        logger.info(f"收到 SQL 优化请求: {request_id}")
+        logger.info("收到 SQL 优化请求: %s", request_id)
 
         # 单 Agent 执行完整优化分析
-        optimization_result = sql_optimizer_instance.optimize_sql(request.sql_query)
+        optimization_result = await optimize_sql_cached(request.sql_query, request.optimization_level, request.force_refresh)
 
         # 单 Agent 已经包含完整的分析和优化，无需额外的审核步骤
         review_result = None
         final_status = "OPTIMIZED_BY_SINGLE_AGENT"
 
         # 计算处理时间
-        processing_time = (datetime.now() - start_time).total_seconds()
+        processing_time = time.perf_counter() - start_time
+
+        # 不需要审核结果时直接返回精简响应，跳过响应模型的构建与校验
+        if not request.include_review:
+            logger.info("SQL 优化完成: %s, 耗时: %.2fs", request_id, processing_time)
+            return DefaultResponseClass({
+                "request_id": request_id,
+                "status": "success",
+                "message": "SQL 优化完成 (单 Agent 综合分析)",
+                "timestamp": now_iso(),
+                "optimization_result": optimization_result,
+                "final_status": final_status,
+                "processing_time": processing_time
+            })
 
-        response = SQLOptimizationResponse(
+        # 字段均由服务端生成，使用 model_construct 跳过校验
+        response = SQLOptimizationResponse.model_construct(
             request_id=request_id,
             status="success",
             message="SQL 优化完成 (单 Agent 综合分析)",
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             optimization_result=optimization_result,
             review_result=review_result,
             final_status=final_status,
             processing_time=processing_time
         )
 
-        logger.info(f"SQL 优化完成: {request_id}, 耗时: {processing_time:.2f}s")
-        return response
+        logger.info("SQL 优化完成: %s, 耗时: %.2fs", request_id, processing_time)
+        # 直接返回响应对象，跳过 FastAPI 按 response_model 的二次校验与编码（response_model 仅用于文档）
+        return DefaultResponseClass(response.model_dump(mode="json"))
 
     except Exception as e:
-        logger.error(f"SQL 优化失败: {request_id}, 错误: {str(e)}")
+        logger.error("SQL 优化失败: %s, 错误: %s", request_id, e)
         raise HTTPException(
             status_code=500,
             detail=f"SQL 优化失败: {str(e)}"
@@ -282,7 +594,7 @@ async def optimize_sql_async(request: SQLOptimizationRequest, background_tasks:
 
     返回任务 ID，可以通过 /api/task/{task_id} 查询状态
     """
-    if not sql_optimizer_instance:
+    if not app.state.optimizer:
         raise HTTPException(
             status_code=503,
             detail="SQL 优化器未初始化，服务暂时不可用"
@@ -291,39 +603,52 @@ async def optimize_sql_async(request: SQLOptimizationRequest, background_tasks:
     # 生成任务 ID
     task_id = str(uuid.uuid4())
 
-    # 创建任务状态
-    task_status = TaskStatus(
+    # 创建任务状态（字段均由服务端生成，跳过校验）
+    submitted_at = datetime.now().isoformat()
+    task_status = TaskStatus.model_construct(
         task_id=task_id,
         status="pending",
         message="任务已提交，等待单 Agent 处理",
         progress=0.0,
-        created_at=datetime.now().isoformat(),
-        updated_at=datetime.now().isoformat()
+        created_at=submitted_at,
+        updated_at=submitted_at
     )
-    task_store[task_id] = task_status
-
-    # 添加后台任务
-    background_tasks.add_task(process_optimization_task_single_agent, task_id, request)
+    await task_store.set(task_status)
+
+    # 投递任务：Redis 可用时交给批量写入协程写入持久化队列，否则作为进程内后台任务执行
+    if app.state.submit_queue is not None:
+        await app.state.submit_queue.put({
+            "task_id": task_id,
+            "sql_query": request.sql_query,
+            "optimization_level": request.optimization_level or "standard",
+            "force_refresh": int(request.force_refresh)
+        })
+    else:
+        background_tasks.add_task(process_optimization_task_single_agent, task_id, request)
 
     return {
         "task_id": task_id,
         "status": "submitted",
         "message": "优化任务已提交 (单 Agent 处理)",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": submitted_at
     }
 
 async def process_optimization_task_single_agent(task_id: str, request: SQLOptimizationRequest):
     """后台处理优化任务 - 单 Agent 架构"""
     try:
         # 更新状态为处理中
-        task_status = task_store[task_id]
+        task_status = await task_store.get(task_id)
+        if task_status is None:
+            logger.warning("任务已不存在，跳过处理: %s", task_id)
+            return
         task_status.status = "processing"
         task_status.message = "单 Agent 正在执行 SQL 优化分析..."
         task_status.progress = 50.0
         task_status.updated_at = datetime.now().isoformat()
+        await task_store.set(task_status)
 
         # 单 Agent 执行完整优化分析
-        optimization_result = sql_optimizer_instance.optimize_sql(request.sql_query)
+        optimization_result = await optimize_sql_cached(request.sql_query, request.optimization_level, request.force_refresh)
 
         # 更新为完成状态
         task_status.status = "completed"
@@ -335,38 +660,184 @@ async def process_optimization_task_single_agent(task_id: str, request: SQLOptim
             "review": None,  # 单 Agent 已包含综合分析，无需单独审核
             "final_status": "OPTIMIZED_BY_SINGLE_AGENT"
         }
+        await task_store.set(task_status)
 
     except Exception as e:
-        logger.error(f"单 Agent 后台任务失败: {task_id}, 错误: {str(e)}")
+        logger.error("单 Agent 后台任务失败: %s, 错误: %s", task_id, e)
         # 更新为失败状态
-        task_status = task_store[task_id]
-        task_status.status = "failed"
-        task_status.message = f"单 Agent 任务失败: {str(e)}"
-        task_status.updated_at = datetime.now().isoformat()
+        task_status = await task_store.get(task_id)
+        if task_status is not None:
+            task_status.status = "failed"
+            task_status.message = f"单 Agent 任务失败: {str(e)}"
+            task_status.updated_at = datetime.now().isoformat()
+            await task_store.set(task_status)
+
+async def optimization_submit_writer(submit_queue: asyncio.Queue):
+    """
+    批量将提交的优化任务写入 Redis Stream
 
-@app.get("/api/task/{task_id}", response_model=TaskStatus)
-async def get_task_status(task_id: str):
-    """获取任务状态"""
-    if task_id not in task_store:
+    取到一个任务后顺带取出队列中已积压的任务（最多 OPTIMIZE_SUBMIT_BATCH_SIZE 个），
+    通过一次非事务 pipeline 写入，突发提交时多个 XADD 只需一次网络往返。
+    """
+    redis = task_store.redis
+    while True:
+        batch = [await submit_queue.get()]
+        while len(batch) < OPTIMIZE_SUBMIT_BATCH_SIZE:
+            try:
+                batch.append(submit_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+        try:
+            for attempt in range(1, OPTIMIZE_SUBMIT_RETRIES + 1):
+                try:
+                    pipe = redis.pipeline(transaction=False)
+                    for fields in batch:
+                        pipe.xadd(OPTIMIZE_STREAM, fields)
+                    await pipe.execute()
+                    break
+                except Exception as e:
+                    logger.warning("批量写入优化任务失败 (%s 个, 第 %s/%s 次): %s", len(batch), attempt, OPTIMIZE_SUBMIT_RETRIES, e)
+                    if attempt < OPTIMIZE_SUBMIT_RETRIES:
+                        await asyncio.sleep(0.5 * attempt)
+            else:
+                # 客户端已收到提交成功的响应，重试耗尽后将任务标记为失败，避免永远停留在 pending
+                logger.error("批量写入优化任务重试耗尽，标记 %s 个任务失败", len(batch))
+                await mark_tasks_failed([fields["task_id"] for fields in batch], "任务提交到优化队列失败，请重新提交")
+        finally:
+            for _ in batch:
+                submit_queue.task_done()
+
+async def mark_tasks_failed(task_ids: List[str], message: str):
+    """将无法进入处理流程的任务更新为失败状态，避免客户端一直看到 pending"""
+    for task_id in task_ids:
+        try:
+            task_status = await task_store.get(task_id)
+            if task_status is not None:
+                task_status.status = "failed"
+                task_status.message = message
+                task_status.updated_at = datetime.now().isoformat()
+                await task_store.set(task_status)
+        except Exception as e:
+            logger.error("更新任务失败状态失败: %s, 错误: %s", task_id, e)
+
+async def optimization_queue_worker(consumer_name: str):
+    """
+    从 Redis Stream 消费异步优化任务
+
+    阻塞读取新消息，任务处理完成后 XACK 确认；空闲时通过 XAUTOCLAIM 接管
+    长时间未确认的消息（所属消费者进程崩溃/重启），保证任务不丢失。
+    消费组在循环内创建（已存在时 Redis 返回 BUSYGROUP，视为成功），Redis 暂不可用时退避重试。
+    """
+    redis = task_store.redis
+    group_ready = False
+    failures = 0
+    while True:
+        try:
+            if not group_ready:
+                try:
+                    await redis.xgroup_create(OPTIMIZE_STREAM, OPTIMIZE_CONSUMER_GROUP, id="0", mkstream=True)
+                except Exception as e:
+                    if "BUSYGROUP" not in str(e):
+                        raise
+                group_ready = True
+
+            entries = await redis.xreadgroup(
+                OPTIMIZE_CONSUMER_GROUP,
+                consumer_name,
+                {OPTIMIZE_STREAM: ">"},
+                count=1,
+                block=5000
+            )
+            messages = entries[0][1] if entries else []
+            if not messages:
+                claimed = await redis.xautoclaim(
+                    OPTIMIZE_STREAM,
+                    OPTIMIZE_CONSUMER_GROUP,
+                    consumer_name,
+                    min_idle_time=OPTIMIZE_CLAIM_IDLE_MS,
+                    count=1
+                )
+                messages = claimed[1]
+
+            for message_id, fields in messages:
+                task_id = fields.get("task_id")
+                try:
+                    if not task_id:
+                        raise KeyError("task_id")
+                    request = SQLOptimizationRequest(
+                        sql_query=fields["sql_query"],
+                        optimization_level=fields.get("optimization_level", "standard"),
+                        force_refresh=fields.get("force_refresh") == "1"
+                    )
+                except Exception as e:
+                    # 无效消息直接确认并删除，否则会被 XAUTOCLAIM 反复接管
+                    logger.error("丢弃无效的优化任务消息 %s: %s", message_id, e)
+                    request = None
+                if request is not None:
+                    await process_optimization_task_single_agent(task_id, request)
+                elif task_id:
+                    await mark_tasks_failed([task_id], "任务消息无效，请重新提交")
+
+                # 确认后删除消息，已处理的任务 (含最长 10000 字符的 SQL) 不在流中长期保留
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.xack(OPTIMIZE_STREAM, OPTIMIZE_CONSUMER_GROUP, message_id)
+                    pipe.xdel(OPTIMIZE_STREAM, message_id)
+                    await pipe.execute()
+            failures = 0
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 流或消费组被删除 (NOGROUP) 时下一轮重新创建；连续失败按指数退避，最长 30 秒
+            if "NOGROUP" in str(e):
+                group_ready = False
+            failures += 1
+            logger.error("优化任务队列消费失败 (%s): %s", consumer_name, e)
+            await asyncio.sleep(min(2 ** (failures - 1), 30))
+
+# 终态任务不再变化，轮询客户端可按 Cache-Control 直接复用
+TERMINAL_TASK_STATUSES = frozenset({"completed", "failed"})
+TERMINAL_TASK_CACHE_CONTROL = "private, max-age=300"
+
+def task_etag(task_status: TaskStatus) -> str:
+    """任务状态 ETag：每次状态变化都会刷新 updated_at，以其与任务 ID 生成"""
+    digest = hashlib.blake2b(f"{task_status.task_id}\0{task_status.updated_at}".encode(), digest_size=8).hexdigest()
+    return f'"{digest}"'
+
+@app.get("/api/task/{task_id}", response_model=None, responses={200: {"model": TaskStatus}, 304: {"description": "任务状态未变化"}})
+async def get_task_status(task_id: str, request: Request):
+    """获取任务状态（支持 If-None-Match 条件请求，状态未变化时返回 304）"""
+    task_status = await task_store.get(task_id)
+    if task_status is None:
         raise HTTPException(status_code=404, detail="任务不存在")
 
-    return task_store[task_id]
+    etag = task_etag(task_status)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": TERMINAL_TASK_CACHE_CONTROL if task_status.status in TERMINAL_TASK_STATUSES else "no-cache"
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    return DefaultResponseClass(task_status.model_dump(mode="json"), headers=headers)
 
 @app.get("/api/tasks")
-async def list_tasks():
-    """列出所有任务"""
-    return {
-        "tasks": list(task_store.values()),
-        "total": len(task_store)
-    }
+async def list_tasks(offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1)):
+    """列出任务（支持 offset / limit 分页，total 为任务总数）"""
+    tasks = await task_store.list(offset, limit)
+    return DefaultResponseClass({
+        "tasks": [task.model_dump(mode="json") for task in tasks],
+        "total": await task_store.count()
+    })
 
 @app.delete("/api/task/{task_id}")
 async def delete_task(task_id: str):
     """删除任务"""
-    if task_id not in task_store:
+    if not await task_store.delete(task_id):
         raise HTTPException(status_code=404, detail="任务不存在")
 
-    del task_store[task_id]
     return {"message": "任务已删除"}
 
 # ============================================================================
@@ -384,14 +855,12 @@ def verify_gitlab_signature(payload_body: bytes, signature_header: str, token_he
         # GitLab 支持多种验证方式
         # 1. Token 验证 (推荐)
         if token_header:
-            expected_token = GITHUB_WEBHOOK_SECRET
-            if token_header == expected_token:
+            # 使用恒定时间比较防止时序攻击，且不记录 token 内容
+            if hmac.compare_digest(token_header.encode('utf-8'), WEBHOOK_SECRET_BYTES):
                 logger.info("✅ GitLab Token 验证成功")
                 return True
             else:
                 logger.error("❌ GitLab Token 验证失败")
-                logger.error(f"Expected: {expected_token}")
-                logger.error(f"Received: {token_header}")
                 return False
 
         # 2. X-Gitlab-Token header 验证
@@ -404,27 +873,26 @@ def verify_gitlab_signature(payload_body: bytes, signature_header: str, token_he
                 hash_algorithm, gitlab_signature = signature_header.split('=', 1)
 
                 if hash_algorithm == 'sha256':
-                    # 计算预期的签名
-                    mac = hmac.new(
-                        GITHUB_WEBHOOK_SECRET.encode('utf-8'),
-                        msg=payload_body,
-                        digestmod=hashlib.sha256
-                    )
-                    expected_signature = mac.hexdigest()
+                    # 计算预期的签名（OpenSSL 单次 HMAC，返回原始字节，无需十六进制编码）
+                    expected_signature = hmac.digest(WEBHOOK_SECRET_BYTES, payload_body, 'sha256')
+
+                    try:
+                        received_signature = bytes.fromhex(gitlab_signature)
+                    except ValueError:
+                        logger.error("❌ GitLab 签名不是合法的十六进制字符串")
+                        return False
 
                     # 使用恒定时间比较防止时序攻击
-                    is_valid = hmac.compare_digest(expected_signature, gitlab_signature)
+                    is_valid = hmac.compare_digest(expected_signature, received_signature)
 
                     if not is_valid:
                         logger.error("❌ GitLab Webhook 签名验证失败")
-                        logger.error(f"Expected: sha256={expected_signature}")
-                        logger.error(f"Received: {signature_header}")
                     else:
                         logger.info("✅ GitLab Webhook 签名验证成功")
 
                     return is_valid
                 else:
-                    logger.error(f"❌ 不支持的哈希算法: {hash_algorithm}")
+                    logger.error("❌ 不支持的哈希算法: %s", hash_algorithm)
                     return False
             else:
                 logger.error("❌ GitLab 签名格式错误，应以 'sha256=' 开头")
@@ -435,25 +903,25 @@ def verify_gitlab_signature(payload_body: bytes, signature_header: str, token_he
         return True  # 测试环境下允许通过
 
     except Exception as e:
-        logger.error(f"❌ GitLab 签名验证过程中发生错误: {e}")
+        logger.error("❌ GitLab 签名验证过程中发生错误: %s", e)
         return False
 
 def extract_sql_files(commits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """从提交中提取 SQL 文件 (支持 GitLab webhook 格式)"""
     sql_files = []
 
-    logger.info(f"开始处理 {len(commits)} 个提交")
+    logger.info("开始处理 %s 个提交", len(commits))
 
     for commit in commits:
         # 检查 commit 是否为字典类型
         if not isinstance(commit, dict):
-            logger.error(f"Commit 不是字典类型: {type(commit)}")
+            logger.error("Commit 不是字典类型: %s", type(commit))
             continue
 
         commit_id = commit.get('id', '')
         commit_message = commit.get('message', '')
 
-        logger.info(f"处理 commit: {commit_id[:8]} - {commit_message[:50]}")
+        logger.debug("处理 commit: %s - %s", commit_id[:8], commit_message[:50])
 
         # GitLab webhook 中文件变更信息
         # GitLab 使用 'added', 'modified', 'removed' 字段
@@ -461,50 +929,109 @@ def extract_sql_files(commits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         modified = commit.get('modified', [])
         removed = commit.get('removed', [])
 
-        logger.info(f"文件变更统计 - 新增: {len(added)}, 修改: {len(modified)}, 删除: {len(removed)}")
+        logger.debug("文件变更统计 - 新增: %d, 修改: %d, 删除: %d", len(added), len(modified), len(removed))
 
-        # 合并所有变更的文件
-        all_changed_files = []
+        # 没有新增或修改的文件（如仅删除文件、合并提交）时直接跳过
+        if not added and not modified:
+            continue
 
-        # 处理添加的文件
-        for file_info in added:
-            if isinstance(file_info, dict):
-                # GitLab 可能返回文件对象而不是字符串
-                file_path = file_info.get('path', '')
-                all_changed_files.append({'path': file_path, 'action': 'added'})
-            else:
-                all_changed_files.append({'path': file_info, 'action': 'added'})
+        # 单次遍历新增与修改的文件，直接筛选 SQL 文件（GitLab 可能返回文件对象而不是字符串）
+        for action, changed_files in (('added', added), ('modified', modified)):
+            for file_info in changed_files:
+                file_path = file_info.get('path', '') if isinstance(file_info, dict) else file_info
+
+                if file_path.lower().endswith('.sql'):
+                    sql_files.append({
+                        'file_path': file_path,
+                        'commit_id': commit_id,
+                        'commit_message': commit_message,
+                        'action': action
+                    })
+                    logger.debug("发现 SQL 文件: %s", file_path)
+
+    logger.info("总共发现 %s 个 SQL 文件", len(sql_files))
+    return sql_files
 
-        # 处理修改的文件
-        for file_info in modified:
-            if isinstance(file_info, dict):
-                file_path = file_info.get('path', '')
-                all_changed_files.append({'path': file_path, 'action': 'modified'})
-            else:
-                all_changed_files.append({'path': file_info, 'action': 'modified'})
+async def run_git_command(cmd: List[str], env: Dict[str, str], timeout: int, cwd: Optional[Path] = None) -> subprocess.CompletedProcess:
+    """以异步子进程执行 git 命令（通过 cwd 指定工作目录），不阻塞事件循环也不占用线程；超时时终止进程并抛出 TimeoutExpired"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+        cwd=cwd
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+    return subprocess.CompletedProcess(
+        cmd,
+        proc.returncode,
+        stdout.decode('utf-8', errors='replace'),
+        stderr.decode('utf-8', errors='replace')
+    )
 
-        # 提取 SQL 文件
-        for file_info in all_changed_files:
-            file_path = file_info.get('path', file_info if isinstance(file_info, str) else '')
-
-            if file_path.lower().endswith('.sql'):
-                sql_files.append({
-                    'file_path': file_path,
-                    'commit_id': commit_id,
-                    'commit_message': commit_message,
-                    'action': file_info.get('action', 'modified')
-                })
-                logger.info(f"发现 SQL 文件: {file_path}")
-
-    logger.info(f"总共发现 {len(sql_files)} 个 SQL 文件")
-    return sql_files
+@lru_cache(maxsize=1)
+def get_gitlab_client() -> httpx.AsyncClient:
+    """GitLab API 共享客户端（复用连接池）"""
+    return httpx.AsyncClient(
+        base_url=GITLAB_API_URL,
+        headers={"PRIVATE-TOKEN": GITLAB_TOKEN},
+        timeout=30.0
+    )
 
-async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: str) -> Optional[str]:
-    """通过 SSH 从 GitLab 获取文件内容"""
-    if not ssh_configured:
-        logger.warning("SSH 配置未完成，无法获取文件内容")
+async def fetch_file_content_api(repo_full_name: str, file_path: str, commit_sha: str) -> Optional[str]:
+    """通过 GitLab REST API 读取指定 commit 下的单个文件"""
+    # 项目标识使用 URL 编码后的完整路径（GitLab 直接接受，无需额外请求解析项目 ID）
+    project_path = quote(f"{GITLAB_PROJECT_NAMESPACE}/{repo_full_name}", safe='')
+    url = f"/projects/{project_path}/repository/files/{quote(file_path, safe='')}/raw"
+    try:
+        response = await get_gitlab_client().get(url, params={"ref": commit_sha})
+    except httpx.HTTPError as e:
+        logger.warning("GitLab API 请求失败: %s, 错误: %s", file_path, e)
         return None
 
+    if response.status_code != 200:
+        logger.warning("GitLab API 读取文件失败: %s, 状态码: %s", file_path, response.status_code)
+        return None
+
+    content = response.content.decode('utf-8', errors='ignore')
+    logger.info("通过 GitLab API 读取文件内容，长度: %s 字符", len(content))
+    return content
+
+async def fetch_files_content(repo_full_name: str, file_paths: List[str], commit_sha: str) -> Dict[str, str]:
+    """
+    从 GitLab 批量获取同一 commit 下的文件内容，返回 {文件路径: 内容}，获取失败的文件不包含在结果中
+
+    配置了 GITLAB_TOKEN 时通过 REST API 并发读取目标文件（并发数受 SQL_REVIEW_CONCURRENCY 限制）；
+    其余文件通过一次 SSH 克隆后在本地检出
+    """
+    contents: Dict[str, str] = {}
+
+    if GITLAB_TOKEN:
+        fetch_semaphore = asyncio.Semaphore(SQL_REVIEW_CONCURRENCY)
+
+        async def fetch_one(file_path: str) -> Optional[str]:
+            async with fetch_semaphore:
+                return await fetch_file_content_api(repo_full_name, file_path, commit_sha)
+
+        fetched = await asyncio.gather(*(fetch_one(file_path) for file_path in file_paths))
+        for file_path, content in zip(file_paths, fetched):
+            if content is not None:
+                contents[file_path] = content
+
+    remaining_paths = [file_path for file_path in file_paths if file_path not in contents]
+    if not remaining_paths:
+        return contents
+
+    if not app.state.ssh_configured:
+        logger.warning("SSH 配置未完成，无法获取文件内容")
+        return contents
+
     # 创建临时目录
     try:
         # 设置 SSH 环境
@@ -517,7 +1044,7 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
         default_key = Path.home() / ".ssh" / "id_rsa"
         if default_key.exists():
             ssh_command_parts.append(f"-i {default_key}")
-            logger.info(f"使用默认 SSH 密钥: {default_key}")
+            logger.info("使用默认 SSH 密钥: %s", default_key)
         else:
             logger.warning("未找到 SSH 密钥，使用默认 SSH 配置")
                 
@@ -533,7 +1060,7 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
         if ssh_command_parts:
             ssh_command = f"ssh {' '.join(ssh_command_parts)}"
             env['GIT_SSH_COMMAND'] = ssh_command
-            logger.info(f"SSH 命令: {ssh_command}")
+            logger.info("SSH 命令: %s", ssh_command)
 
         # 设置 Git 用户信息
         env['GIT_AUTHOR_NAME'] = GITHUB_USER
@@ -543,16 +1070,13 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
 
         repo_url = f"ssh://git@git.nd.com.cn:10022/data-tech/monitor/{repo_full_name}.git"
       
-        logger.info(f"尝试克隆仓库: {repo_url}")
-        logger.info(f"仓库完整名称: {repo_full_name}")
+        logger.info("尝试克隆仓库: %s", repo_url)
+        logger.info("仓库完整名称: %s", repo_full_name)
 
         # 使用临时目录，避免路径冲突
-        import tempfile
-        import shutil
-        
         temp_dir = tempfile.mkdtemp(prefix="git_clone_")
         clone_path = Path(temp_dir) / "repo"
-        logger.info(f"使用临时目录: {clone_path}")
+        logger.info("使用临时目录: %s", clone_path)
 
         try:
             # 克隆特定 commit
@@ -561,80 +1085,58 @@ async def fetch_file_content(repo_full_name: str, file_path: str, commit_sha: st
                 '--no-checkout', repo_url, str(clone_path)
             ]
 
-            logger.info(f"执行克隆命令: {' '.join(clone_cmd)}")
-            result = subprocess.run(
-                clone_cmd,
-                capture_output=True,
-                text=True,
-                env=env,
-                timeout=60
-            )
+            logger.info("执行克隆命令: %s", ' '.join(clone_cmd))
+            result = await run_git_command(clone_cmd, env, timeout=60)
 
             if result.returncode != 0:
-                logger.error(f"Git 克隆失败: {result.stderr}")
-                logger.error(f"克隆命令输出: {result.stdout}")
+                logger.error("Git 克隆失败: %s", result.stderr)
+                logger.error("克隆命令输出: %s", result.stdout)
                 # 清理临时目录
                 shutil.rmtree(temp_dir, ignore_errors=True)
-                return None
+                return contents
 
             logger.info("仓库克隆成功")
 
-            # 切换到指定 commit 并检出文件
-            original_cwd = os.getcwd()
-            try:
-                os.chdir(clone_path)
-
-                # 检出特定 commit
+            # 在同一个克隆目录中逐个检出特定 commit 的文件（均为本地操作）
+            for file_path in remaining_paths:
                 checkout_cmd = ['git', 'checkout', commit_sha, '--', file_path]
-                logger.info(f"执行检出命令: {' '.join(checkout_cmd)}")
-
-                result = subprocess.run(
-                    checkout_cmd,
-                    capture_output=True,
-                    text=True,
-                    env=env,
-                    timeout=30
-                )
+                logger.info("执行检出命令: %s", ' '.join(checkout_cmd))
 
-                if result.returncode != 0:
-                    logger.error(f"Git 检出失败: {file_path}, 错误: {result.stderr}")
-                    return None
+                result = await run_git_command(checkout_cmd, env, timeout=30, cwd=clone_path)
 
-                logger.info("文件检出成功")
+                if result.returncode != 0:
+                    logger.error("Git 检出失败: %s, 错误: %s", file_path, result.stderr)
+                    continue
 
                 # 读取文件内容
                 file_full_path = clone_path / file_path
                 if file_full_path.exists():
                     content = file_full_path.read_text(encoding='utf-8', errors='ignore')
-                    logger.info(f"成功读取文件内容，长度: {len(content)} 字符")
-                    return content
+                    logger.info("成功读取文件内容: %s, 长度: %s 字符", file_path, len(content))
+                    contents[file_path] = content
                 else:
-                    logger.error(f"文件不存在: {file_path}")
-                    return None
+                    logger.error("文件不存在: %s", file_path)
+
+            return contents
 
-            finally:
-                # 恢复原始工作目录
-                os.chdir(original_cwd)
-                
         except subprocess.TimeoutExpired:
-            logger.error(f"Git 操作超时: {file_path}")
-            return None
+            logger.error("Git 操作超时: %s@%s", repo_full_name, commit_sha)
+            return contents
         except Exception as e:
-            logger.error(f"通过 SSH 获取文件内容失败: {e}")
-            import traceback
-            logger.error(f"详细错误信息: {traceback.format_exc()}")
-            return None
+            logger.error("通过 SSH 获取文件内容失败: %s", e)
+            logger.error("详细错误信息: %s", traceback.format_exc())
+            return contents
         finally:
             # 清理临时目录
             try:
                 shutil.rmtree(temp_dir, ignore_errors=True)
-                logger.info(f"已清理临时目录: {temp_dir}")
+                logger.info("已清理临时目录: %s", temp_dir)
             except Exception as e:
-                logger.warning(f"清理临时目录失败: {e}")
+                logger.warning("清理临时目录失败: %s", e)
 
     except Exception as e:
-        logger.error(f"创建临时目录或克隆仓库失败: {e}")
-        return None
+        logger.error("创建临时目录或克隆仓库失败: %s", e)
+        return contents
 
 async def post_github_comment(repo_full_name: str, commit_sha: str, comment: str) -> bool:
     """在 Git commit 上发布评论 (支持 SSH 方式，适用于 git.nd.com.cn)"""
@@ -644,16 +1146,10 @@ async def post_github_comment(repo_full_name: str, commit_sha: str, comment: str
     logger.info("使用 SSH 方式创建评论 tag (适用于 git.nd.com.cn)")
 
     # 使用 SSH 方式创建带评论的 tag
-    if not ssh_configured:
+    if not app.state.ssh_configured:
         logger.warning("SSH 配置未完成且无 Token，无法发布评论")
         return False
 
-    import tempfile
-    import shutil
-    
-    temp_dir = None
-    original_cwd = os.getcwd()
-    
     try:
         # 设置 SSH 环境
         env = os.environ.copy()
@@ -674,103 +1170,96 @@ async def post_github_comment(repo_full_name: str, commit_sha: str, comment: str
 
         # 构建仓库 URL
         repo_url = f"ssh://git@git.nd.com.cn:10022/data-tech/monitor/{repo_full_name}.git"
-        logger.info(f"克隆仓库用于创建 tag: {repo_url}")
-
-        # 创建临时目录并克隆仓库
-        temp_dir = tempfile.mkdtemp(prefix="git_tag_")
-        clone_path = Path(temp_dir) / "repo"
-        
-        # 浅克隆仓库
-        clone_cmd = ['git', 'clone', '--depth', '50', repo_url, str(clone_path)]
-        result = subprocess.run(
-            clone_cmd,
-            capture_output=True,
-            text=True,
-            env=env,
-            timeout=60
-        )
+        repo_path = GIT_WORK_ROOT / repo_full_name.replace('/', '__')
+
+        # 同一仓库的 fetch/tag/push 串行执行，避免并发 webhook 互相干扰
+        async with repo_locks.setdefault(repo_full_name, asyncio.Lock()):
+            if not (repo_path / ".git").exists():
+                logger.info("初始化本地仓库用于创建 tag: %s", repo_url)
+                repo_path.mkdir(parents=True, exist_ok=True)
+                for init_cmd in (['git', 'init', '-q'], ['git', 'remote', 'add', 'origin', repo_url]):
+                    result = await run_git_command(init_cmd, env, timeout=30, cwd=repo_path)
+                    if result.returncode != 0:
+                        logger.error("初始化本地仓库失败: %s", result.stderr)
+                        shutil.rmtree(repo_path, ignore_errors=True)
+                        return False
+
+            # 只增量获取目标 commit
+            fetch_cmd = ['git', 'fetch', '--depth', '1', 'origin', commit_sha]
+            result = await run_git_command(fetch_cmd, env, timeout=60, cwd=repo_path)
 
-        if result.returncode != 0:
-            logger.error(f"克隆仓库失败: {result.stderr}")
-            return False
-
-        logger.info("仓库克隆成功，准备创建 tag")
+            if result.returncode != 0:
+                logger.error("获取 commit 失败: %s", result.stderr)
+                return False
 
-        # 切换到仓库目录
-        os.chdir(clone_path)
+            logger.info("commit 获取成功，准备创建 tag")
 
-        # 创建带评论的 tag
-        tag_name = f"sql-review-{commit_sha[:8]}"
-        tag_message = f"SQL 优化审核报告\n\n{comment[:5000]}"  # 限制长度
+            # 创建带评论的 tag
+            tag_name = f"sql-review-{commit_sha[:8]}"
+            tag_message = f"SQL 优化审核报告\n\n{comment[:5000]}"  # 限制长度
 
-        # 创建 annotated tag
-        tag_cmd = ['git', 'tag', '-a', tag_name, commit_sha, '-m', tag_message]
-        logger.info(f"创建 tag: {tag_name} 指向 {commit_sha}")
-        
-        result = subprocess.run(
-            tag_cmd,
-            capture_output=True,
-            text=True,
-            env=env,
-            timeout=30
-        )
+            # 创建 annotated tag（本地仓库复用，已存在的同名本地 tag 直接覆盖）
+            tag_cmd = ['git', 'tag', '-a', '-f', tag_name, commit_sha, '-m', tag_message]
+            logger.info("创建 tag: %s 指向 %s", tag_name, commit_sha)
+            
+            result = await run_git_command(tag_cmd, env, timeout=30, cwd=repo_path)
 
-        if result.returncode != 0:
-            logger.error(f"Git tag 创建失败: {result.stderr}")
-            logger.error(f"标准输出: {result.stdout}")
-            return False
+            if result.returncode != 0:
+                logger.error("Git tag 创建失败: %s", result.stderr)
+                logger.error("标准输出: %s", result.stdout)
+                return False
 
-        logger.info(f"Tag 创建成功: {tag_name}")
+            logger.info("Tag 创建成功: %s", tag_name)
 
-        # 推送 tag
-        push_cmd = ['git', 'push', 'origin', tag_name]
-        result = subprocess.run(
-            push_cmd,
-            capture_output=True,
-            text=True,
-            env=env,
-            timeout=30
-        )
+            try:
+                # 推送 tag
+                push_cmd = ['git', 'push', 'origin', tag_name]
+                result = await run_git_command(push_cmd, env, timeout=30, cwd=repo_path)
+            finally:
+                await cleanup_comment_repo(repo_full_name, repo_path, tag_name, env)
 
-        if result.returncode == 0:
-            logger.info(f"✅ 通过 SSH 创建并推送评论 tag: {tag_name}")
-            return True
-        else:
-            logger.error(f"Git push 失败: {result.stderr}")
-            return False
+            if result.returncode == 0:
+                logger.info("✅ 通过 SSH 创建并推送评论 tag: %s", tag_name)
+                return True
+            else:
+                logger.error("Git push 失败: %s", result.stderr)
+                return False
 
     except subprocess.TimeoutExpired:
         logger.error("Git 操作超时")
         return False
     except Exception as e:
-        logger.error(f"SSH 方式发布评论失败: {e}")
-        import traceback
-        logger.error(f"详细错误: {traceback.format_exc()}")
+        logger.error("SSH 方式发布评论失败: %s", e)
+        logger.error("详细错误: %s", traceback.format_exc())
         return False
-    finally:
-        # 恢复原始工作目录
-        try:
-            os.chdir(original_cwd)
-        except Exception:
-            pass
-        
-        # 清理临时目录
-        if temp_dir:
-            try:
-                shutil.rmtree(temp_dir, ignore_errors=True)
-                logger.info(f"已清理临时目录: {temp_dir}")
-            except Exception as e:
-                logger.warning(f"清理临时目录失败: {e}")
+
+async def cleanup_comment_repo(repo_full_name: str, repo_path: Path, tag_name: str, env: Dict[str, str]):
+    """
+    清理复用的本地仓库：删除已推送的本地 tag，并每 GIT_GC_INTERVAL 次执行一次 git gc，
+    回收不再被引用的 commit 对象与 shallow 记录，避免目录随 webhook 次数无限增长
+    """
+    try:
+        await run_git_command(['git', 'tag', '-d', tag_name], env, timeout=30, cwd=repo_path)
+
+        repo_comment_counts[repo_full_name] += 1
+        if repo_comment_counts[repo_full_name] % GIT_GC_INTERVAL == 0:
+            logger.info("清理本地仓库对象: %s", repo_path)
+            result = await run_git_command(['git', 'gc', '--prune=now', '--quiet'], env, timeout=300, cwd=repo_path)
+            if result.returncode != 0:
+                logger.warning("git gc 失败: %s", result.stderr)
+    except Exception as e:
+        logger.warning("清理本地仓库失败: %s, 错误: %s", repo_path, e)
 
 def format_review_comment(reviews: List[SQLReviewResult]) -> str:
     """格式化审核结果为 Markdown 评论"""
     comment_parts = ["## 🔍 SQL 代码审核报告\n"]
     
-    # 统计
+    # 统计（一次遍历统计各严重程度）
     total_files = len(reviews)
-    critical_count = sum(1 for r in reviews if r.severity == 'critical')
-    high_count = sum(1 for r in reviews if r.severity == 'high')
-    medium_count = sum(1 for r in reviews if r.severity == 'medium')
+    severity_counts = Counter(r.severity for r in reviews)
+    critical_count = severity_counts['critical']
+    high_count = severity_counts['high']
+    medium_count = severity_counts['medium']
     
     comment_parts.append(f"**总计**: {total_files} 个 SQL 文件\n")
     
@@ -783,39 +1272,29 @@ def format_review_comment(reviews: List[SQLReviewResult]) -> str:
     
     comment_parts.append("\n---\n\n")
     
-    # 每个文件的详细信息
+    # 每个文件的详细信息（固定文本合并为单个片段，减少片段数量）
     for review in reviews:
-        severity_emoji = {
-            'critical': '🚨',
-            'high': '⚠️',
-            'medium': '💡',
-            'low': '✅'
-        }.get(review.severity, '📝')
+        severity_emoji = SEVERITY_EMOJI.get(review.severity, '📝')
         
-        comment_parts.append(f"### {severity_emoji} {review.file_path}\n\n")
-        comment_parts.append(f"**状态**: {review.status}\n\n")
+        comment_parts.append(f"### {severity_emoji} {review.file_path}\n\n**状态**: {review.status}\n\n")
         
         if review.issues:
             comment_parts.append("**发现的问题**:\n")
-            for i, issue in enumerate(review.issues[:5], 1):  # 限制显示前5个
-                comment_parts.append(f"{i}. {issue}\n")
+            comment_parts.extend(f"{i}. {issue}\n" for i, issue in enumerate(review.issues[:5], 1))  # 限制显示前5个
             comment_parts.append("\n")
         
         if review.optimizations:
             comment_parts.append("**优化建议**:\n")
-            for i, opt in enumerate(review.optimizations[:3], 1):  # 限制显示前3个
-                comment_parts.append(f"{i}. {opt}\n")
+            comment_parts.extend(f"{i}. {opt}\n" for i, opt in enumerate(review.optimizations[:3], 1))  # 限制显示前3个
             comment_parts.append("\n")
         
-        if review.optimized_sql:
-            comment_parts.append("<details>\n")
-            comment_parts.append("<summary>查看优化后的 SQL</summary>\n\n")
-            comment_parts.append("```sql\n")
-            comment_parts.append(review.optimized_sql[:4000])  # 限制长度
-            if len(review.optimized_sql) > 4000:
-                comment_parts.append("\n... (已截断)")
-            comment_parts.append("\n```\n")
-            comment_parts.append("</details>\n\n")
+        optimized_sql = review.optimized_sql
+        if optimized_sql:
+            truncated_note = "\n... (已截断)" if len(optimized_sql) > 4000 else ""  # 限制长度
+            comment_parts.append(
+                f"<details>\n<summary>查看优化后的 SQL</summary>\n\n```sql\n"
+                f"{optimized_sql[:4000]}{truncated_note}\n```\n</details>\n\n"
+            )
         
         comment_parts.append("---\n\n")
     
@@ -840,20 +1319,30 @@ async def gitlab_webhook(
     环境变量:
     - GITHUB_WEBHOOK_SECRET: webhook 密钥（用于验证请求）
     """
+    return await handle_webhook_push(request, background_tasks, "GitLab")
+
+# 保留 GitHub webhook 端点作为备用，使用 GitLab 处理逻辑
+@app.post("/api/webhook/github", response_model=WebhookResponse)
+async def github_webhook_fallback(request: Request, background_tasks: BackgroundTasks):
+    """GitHub Webhook 备用端点，使用 GitLab 处理逻辑"""
+    return await handle_webhook_push(request, background_tasks, "GitHub")
+
+async def handle_webhook_push(request: Request, background_tasks: BackgroundTasks, source: str) -> WebhookResponse:
+    """处理 webhook push 事件（GitLab / GitHub 备用端点共用）：验证、提取 SQL 文件并提交后台审核"""
     webhook_id = str(uuid.uuid4())
 
     try:
         # 读取请求体
         payload_body = await request.body()
 
-        # 手动获取 GitLab headers
-        headers = dict(request.headers)
-        x_gitlab_token = headers.get("x-gitlab-token") or headers.get("X-Gitlab-Token")
-        x_gitlab_event = headers.get("x-gitlab-event") or headers.get("X-Gitlab-Event")
-        x_gitlab_signature = headers.get("x-gitlab-signature") or headers.get("X-Gitlab-Signature")
+        # 获取 GitLab headers（Starlette Headers 本身不区分大小写）
+        headers = request.headers
+        x_gitlab_token = headers.get("x-gitlab-token")
+        x_gitlab_event = headers.get("x-gitlab-event")
+        x_gitlab_signature = headers.get("x-gitlab-signature")
 
-        logger.info(f"收到 GitLab webhook 请求，事件: {x_gitlab_event}")
-        logger.info(f"Token: {x_gitlab_token is not None}, Signature: {x_gitlab_signature is not None}")
+        logger.info("收到 %s webhook 请求，事件: %s", source, x_gitlab_event)
+        logger.info("Token: %s, Signature: %s", x_gitlab_token is not None, x_gitlab_signature is not None)
 
         # 验证签名或token
         if not verify_gitlab_signature(payload_body, x_gitlab_signature, x_gitlab_token):
@@ -862,33 +1351,34 @@ async def gitlab_webhook(
 
         # 只处理 push 事件
         if x_gitlab_event != "Push Hook":
-            logger.info(f"忽略非 push 事件: {x_gitlab_event}")
+            logger.info("忽略非 push 事件: %s", x_gitlab_event)
             return WebhookResponse(
                 webhook_id=webhook_id,
                 status="ignored",
                 message=f"仅处理 Push Hook 事件，当前事件: {x_gitlab_event}",
-                timestamp=datetime.now().isoformat(),
+                timestamp=now_iso(),
                 sql_files_found=0
             )
         
         # 解析 payload
         try:
-            payload = json.loads(payload_body)
-            logger.info(f"Payload type: {type(payload)}")
-            logger.info(f"Payload keys: {payload.keys() if isinstance(payload, dict) else 'Not a dict'}")
+            # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，下方异常处理对两者都适用
+            payload = orjson.loads(payload_body) if orjson is not None else json.loads(payload_body)
+            logger.info("Payload type: %s", type(payload))
+            logger.info("Payload keys: %s", (payload.keys() if isinstance(payload, dict) else 'Not a dict'))
         except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析失败: {e}")
-            logger.error(f"Payload body: {payload_body[:500]}...")  # 显示前500个字符
+            logger.error("JSON 解析失败: %s", e)
+            logger.error("Payload body: %s...", payload_body[:500])  # 显示前500个字符
             raise
 
         # 提取 GitLab 特有信息
         if not isinstance(payload, dict):
-            logger.error(f"Payload 不是字典类型: {type(payload)}")
+            logger.error("Payload 不是字典类型: %s", type(payload))
             raise HTTPException(status_code=400, detail="无效的 webhook payload 格式")
 
         project = payload.get('project', {})
         if not isinstance(project, dict):
-            logger.error(f"Project 字段不是字典类型: {type(project)}")
+            logger.error("Project 字段不是字典类型: %s", type(project))
             project = {}
 
         repo_name = project.get('name', '')  # GitLab 项目名称
@@ -902,7 +1392,7 @@ async def gitlab_webhook(
         # GitLab 的 commits 结构与 GitHub 略有不同
         commits = payload.get('commits', [])
         if not isinstance(commits, list):
-            logger.error(f"Commits 字段不是列表类型: {type(commits)}")
+            logger.error("Commits 字段不是列表类型: %s", type(commits))
             commits = []
 
         if not commits:
@@ -911,7 +1401,7 @@ async def gitlab_webhook(
                 webhook_id=webhook_id,
                 status="no_commits",
                 message="没有找到提交信息",
-                timestamp=datetime.now().isoformat(),
+                timestamp=now_iso(),
                 repository=repo_full_name,
                 sql_files_found=0
             )
@@ -925,13 +1415,13 @@ async def gitlab_webhook(
                 webhook_id=webhook_id,
                 status="no_sql_files",
                 message="没有发现 SQL 文件变更",
-                timestamp=datetime.now().isoformat(),
+                timestamp=now_iso(),
                 repository=repo_full_name,
                 commit=commits[0].get('id', '') if commits else '',
                 sql_files_found=0
             )
 
-        logger.info(f"发现 {len(sql_files)} 个 SQL 文件需要审核")
+        logger.info("发现 %s 个 SQL 文件需要审核", len(sql_files))
 
         # 提交后台任务进行审核
         background_tasks.add_task(
@@ -946,95 +1436,100 @@ async def gitlab_webhook(
             webhook_id=webhook_id,
             status="processing",
             message=f"发现 {len(sql_files)} 个 SQL 文件，正在进行审核",
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             repository=repo_full_name,
             commit=commits[0].get('id', '') if commits else '',
             sql_files_found=len(sql_files)
         )
 
         # 保存到历史记录
-        webhook_history[webhook_id] = response
+        record_webhook(webhook_id, response)
 
         return response
 
+    except HTTPException:
+        raise
     except json.JSONDecodeError:
         logger.error("无法解析 JSON payload")
         raise HTTPException(status_code=400, detail="无效的 JSON payload")
     except Exception as e:
-        logger.error(f"处理 GitLab webhook 失败: {e}")
+        logger.error("处理 %s webhook 失败: %s", source, e)
         raise HTTPException(status_code=500, detail=f"处理 webhook 失败: {str(e)}")
 
-# 保留 GitHub webhook 端点作为备用，但重定向到 GitLab 处理
-@app.post("/api/webhook/github", response_model=WebhookResponse)
-async def github_webhook_fallback(request: Request, background_tasks: BackgroundTasks):
-    """GitHub Webhook 备用端点，重定向到 GitLab 处理"""
-    logger.info("收到 GitHub webhook 请求，使用 GitLab 处理逻辑")
-    return await gitlab_webhook(request, background_tasks)
-
 async def process_sql_reviews_single_agent(webhook_id: str, repo_full_name: str, sql_files: List[Dict[str, Any]], commit_sha: str):
     """后台处理 SQL 文件审核 - 单 Agent 架构"""
     try:
-        reviews = []
+        # 一次性获取本次提交涉及的全部 SQL 文件内容（SSH 方式下只克隆一次仓库）
+        file_contents = await fetch_files_content(
+            repo_full_name, [sql_file['file_path'] for sql_file in sql_files], commit_sha
+        )
+        review_semaphore = asyncio.Semaphore(SQL_REVIEW_CONCURRENCY)
 
-        for sql_file in sql_files:
+        async def review_one(sql_file: Dict[str, Any]) -> SQLReviewResult:
+            """审核单个 SQL 文件"""
             file_path = sql_file['file_path']
-            logger.info(f"单 Agent 审核文件: {file_path}")
+            logger.info("单 Agent 审核文件: %s", file_path)
 
-            # 获取文件内容
-            sql_content = await fetch_file_content(repo_full_name, file_path, commit_sha)
+            sql_content = file_contents.get(file_path)
 
             if not sql_content:
-                reviews.append(SQLReviewResult(
+                return SQLReviewResult(
                     file_path=file_path,
                     status="error",
                     issues=["无法获取文件内容"],
                     severity="medium"
-                ))
-                continue
+                )
 
-            # 调用单 Agent SQL 优化服务
+            # 调用单 Agent SQL 优化服务（通过信号量限制并发的优化调用数）
             try:
-                if sql_optimizer_instance:
-                    optimization_result = sql_optimizer_instance.optimize_sql(sql_content)
+                if app.state.optimizer:
+                    async with review_semaphore:
+                        optimization_result = await optimize_sql_cached(sql_content)
 
                     # 提取问题和优化建议
                     issues = optimization_result.get("issues_found", [])
                     optimizations = optimization_result.get("optimizations_applied", [])
                     optimized_sql = optimization_result.get("optimized_sql", "")
 
-                    # 确定严重程度
+                    # 确定严重程度（问题列表只规整、拼接一次，两个关键字模式共用同一文本）
+                    if not isinstance(issues, list):
+                        issues = [str(issues)]
                     severity = "low"
-                    if any(keyword in str(issues).lower() for keyword in ['critical', '严重', 'error']):
+                    issues_text = "\n".join(map(str, issues))
+                    if CRITICAL_SEVERITY_PATTERN.search(issues_text):
                         severity = "critical"
-                    elif any(keyword in str(issues).lower() for keyword in ['warning', '警告', 'high']):
+                    elif HIGH_SEVERITY_PATTERN.search(issues_text):
                         severity = "high"
                     elif len(issues) > 3:
                         severity = "medium"
 
-                    reviews.append(SQLReviewResult(
+                    return SQLReviewResult(
                         file_path=file_path,
                         status="reviewed",
-                        issues=issues if isinstance(issues, list) else [str(issues)],
+                        issues=issues,
                         optimizations=optimizations if isinstance(optimizations, list) else [str(optimizations)],
                         optimized_sql=optimized_sql,
                         severity=severity
-                    ))
+                    )
                 else:
-                    reviews.append(SQLReviewResult(
+                    return SQLReviewResult(
                         file_path=file_path,
                         status="error",
                         issues=["单 Agent 优化服务未初始化"],
                         severity="medium"
-                    ))
+                    )
 
             except Exception as e:
-                logger.error(f"单 Agent 审核文件 {file_path} 失败: {e}")
-                reviews.append(SQLReviewResult(
+                logger.error("单 Agent 审核文件 %s 失败: %s", file_path, e)
+                return SQLReviewResult(
                     file_path=file_path,
                     status="error",
                     issues=[f"单 Agent 审核失败: {str(e)}"],
                     severity="high"
-                ))
+                )
+
+        # 并发审核各文件，结果保持与 sql_files 相同的顺序
+        reviews = list(await asyncio.gather(*(review_one(sql_file) for sql_file in sql_files)))
 
         # 更新 webhook 历史记录
         if webhook_id in webhook_history:
@@ -1044,13 +1539,13 @@ async def process_sql_reviews_single_agent(webhook_id: str, repo_full_name: str,
 
         # 在 GitHub 上发布评论
         comment = format_review_comment(reviews)
-        logger.info(f"单 Agent 评论内容: {comment}")
+        logger.info("单 Agent 评论内容: %s", comment)
         await post_github_comment(repo_full_name, commit_sha, comment)
 
-        logger.info(f"单 Agent Webhook {webhook_id} 处理完成")
+        logger.info("单 Agent Webhook %s 处理完成", webhook_id)
 
     except Exception as e:
-        logger.error(f"单 Agent 处理 SQL 审核失败: {e}")
+        logger.error("单 Agent 处理 SQL 审核失败: %s", e)
         if webhook_id in webhook_history:
             webhook_history[webhook_id].status = "failed"
             webhook_history[webhook_id].message = f"单 Agent 处理失败: {str(e)}"
@@ -1058,6 +1553,7 @@ async def process_sql_reviews_single_agent(webhook_id: str, repo_full_name: str,
 @app.get("/api/webhook/{webhook_id}", response_model=WebhookResponse)
 async def get_webhook_status(webhook_id: str):
     """获取 webhook 处理状态"""
+    prune_webhook_history()
     if webhook_id not in webhook_history:
         raise HTTPException(status_code=404, detail="Webhook 记录不存在")
     
@@ -1066,6 +1562,7 @@ async def get_webhook_status(webhook_id: str):
 @app.get("/api/webhooks")
 async def list_webhooks():
     """列出所有 webhook 处理记录"""
+    prune_webhook_history()
     return {
         "webhooks": list(webhook_history.values()),
         "total": len(webhook_history)
@@ -1081,59 +1578,66 @@ async def batch_optimize_sql(requests: List[SQLOptimizationRequest]):
     if len(requests) > 10:
         raise HTTPException(status_code=400, detail="批量请求最多支持 10 个 SQL 语句")
 
-    if not sql_optimizer_instance:
+    if not app.state.optimizer:
         raise HTTPException(
             status_code=503,
             detail="SQL 优化器未初始化，服务暂时不可用"
         )
 
-    results = []
-    start_time = datetime.now()
+    start_time = time.perf_counter()
+    batch_semaphore = asyncio.Semaphore(BATCH_OPTIMIZE_CONCURRENCY)
 
-    for i, request in enumerate(requests):
+    async def optimize_one(i: int, request: SQLOptimizationRequest) -> Dict[str, Any]:
+        """优化批量中的单条 SQL，失败时返回失败记录"""
         try:
-            logger.info(f"单 Agent 处理批量优化 {i+1}/{len(requests)}")
+            async with batch_semaphore:
+                logger.info("单 Agent 处理批量优化 %s/%s", i+1, len(requests))
 
-            # 单 Agent 执行完整优化分析
-            optimization_result = sql_optimizer_instance.optimize_sql(request.sql_query)
+                # 单 Agent 执行完整优化分析
+                optimization_result = await optimize_sql_cached(request.sql_query, request.optimization_level, request.force_refresh)
             review_result = None  # 单 Agent 已包含综合分析
             final_status = "OPTIMIZED_BY_SINGLE_AGENT"
 
-            results.append({
+            return {
                 "index": i,
                 "status": "success",
                 "optimization_result": optimization_result,
                 "review_result": review_result,
                 "final_status": final_status
-            })
+            }
 
         except Exception as e:
-            logger.error(f"单 Agent 批量优化第 {i+1} 个失败: {str(e)}")
-            results.append({
+            logger.error("单 Agent 批量优化第 %s 个失败: %s", i+1, e)
+            return {
                 "index": i,
                 "status": "failed",
                 "error": str(e)
-            })
+            }
 
-    processing_time = (datetime.now() - start_time).total_seconds()
+    # 并发优化各条 SQL，结果保持请求顺序
+    results = await asyncio.gather(*(optimize_one(i, request) for i, request in enumerate(requests)))
 
-    return {
+    processing_time = time.perf_counter() - start_time
+
+    # 直接返回响应对象，跳过 jsonable_encoder 对结果的逐层遍历
+    return DefaultResponseClass({
         "batch_id": str(uuid.uuid4()),
         "total": len(requests),
         "successful": sum(1 for r in results if r["status"] == "success"),
         "failed": sum(1 for r in results if r["status"] == "failed"),
         "processing_time": processing_time,
         "results": results,
-        "timestamp": datetime.now().isoformat()
-    }
+        "timestamp": now_iso()
+    })
 
 # 错误处理
 @app.exception_handler(Exception)
-async def global_exception_handler(request, exc):
-    logger.error(f"全局异常: {str(exc)}")
-    return HTTPException(
+async def global_exception_handler(request: Request, exc: Exception):
+    """未处理异常统一返回 500 JSON 响应（异常处理器必须返回 Response 对象）"""
+    logger.exception("全局异常: %s", exc)
+    return DefaultResponseClass(
         status_code=500,
-        detail=f"服务器内部错误: {str(exc)}"
+        content={"detail": f"服务器内部错误: {exc}"}
     )
 
 # 启动命令提示
@@ -1178,10 +1682,15 @@ if __name__ == "__main__":
     ╚══════════════════════════════════════════════════════════════════╝
     """)
 
+    # 默认单 worker：webhook 历史 (webhook_history) 与仓库锁 (repo_locks) 仍是进程内状态，
+    # 多个 worker 会各自只看到部分 webhook 记录，并可能同时操作同一个本地仓库目录；
+    # 仅在确认不使用 webhook 审核时再通过 WEB_CONCURRENCY 开启多 worker (需同时启用 Redis)
     uvicorn.run(
         "fastapi_service:app",
         host="0.0.0.0",
         port=8004,
-        reload=True,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="uvloop",  # uvicorn[standard] 自带 uvloop / httptools
+        http="httptools",
         log_level="info"
     )
\ No newline at end of file
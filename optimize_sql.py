@@ -16,24 +16,28 @@ OPENAI_BASE_URL=your_ollama_url_here
 """
 
 import json
+import logging
 import os
 import re
-import hashlib
+import sys
+import threading
 import time
+from collections import Counter
+from string import Template
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor, as_completed
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
     print("⚠️  dotenv 未安装，跳过 .env 文件加载")
 
-# CrewAI imports
-from crewai import Agent, Task, Crew, Process
-from crewai.tools import tool
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 os.environ["OPENAI_BASE_URL"] = "http://192.168.244.189:11434/v1"
 os.environ["OPENAI_API_KEY"] = "ollama"
@@ -41,6 +45,72 @@ os.environ["OPENAI_API_KEY"] = "ollama"
 # 加载环境变量
 load_dotenv()
 
+# LLM 连接配置 (导入时读取一次)
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# LLM 输出 JSON 提取
+# ============================================================================
+
+# loads_json / extract_first_json 与 requirement_analysis/workflow.py 中的同名函数逐字一致（两个服务独立部署），修改时需同步
+def loads_json(json_str: str) -> Any:
+    """解析 JSON：优先使用 orjson，orjson 拒绝的宽松写法 (NaN/Infinity、超出 64 位的整数) 回退到标准库"""
+    if orjson is not None:
+        try:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(json_str)
+
+def extract_first_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    单次扫描提取文本中第一个可解析的 JSON 对象
+
+    跟踪花括号深度并跳过字符串字面量（含转义），找到平衡的 {...} 即尝试解析；
+    解析失败则从下一个 '{' 继续，避免 find/rfind 切片把多个片段拼在一起。
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            if depth:
+                in_string = True
+        elif ch == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                try:
+                    json_str = text[start:i + 1]
+                    result = loads_json(json_str)
+                    if isinstance(result, dict):
+                        return result
+                except ValueError:
+                    pass
+                # 当前片段不是合法 JSON，从其后第一个 '{' 重新扫描
+                i = start + 1
+                start = -1
+                continue
+        i += 1
+    return None
+
+
 # ============================================================================
 # 高性能 SQL 分析引擎
 # ============================================================================
@@ -48,6 +118,8 @@ load_dotenv()
 @dataclass
 class SQLAnalysisResult:
     """SQL分析结果数据结构"""
+    __slots__ = ('issues', 'suggestions', 'metrics', 'processing_time')
+
     issues: List[str]
     suggestions: List[str]
     metrics: Dict[str, Any]
@@ -71,36 +143,76 @@ class SQLAnalyzer:
         'index_hint': re.compile(r'\bUSE\s+INDEX\b|\bFORCE\s+INDEX\b', re.IGNORECASE)
     }
 
-    def __init__(self):
-        self.cache = {}  # 简单内存缓存
-        self.hit_count = 0
-        self.miss_count = 0
-
-    def _get_sql_hash(self, sql_query: str) -> str:
-        """生成SQL查询的哈希值用于缓存"""
-        normalized_sql = re.sub(r'\s+', ' ', sql_query.strip())
-        return hashlib.md5(normalized_sql.encode()).hexdigest()
+    # 纯关键字模式合并为一个多分支正则，一次 finditer 完成计数，避免逐模式重复扫描 SQL
+    # (select_kw 统计未被 select_star 消费的 SELECT，两者之和即 SELECT 总数，用于子查询判断;
+    #  跨越上下文的 missing_where / or_condition 会吞掉中间的关键字，仍单独匹配)
+    KEYWORD_SCANNER = re.compile(
+        r'(?P<select_star>\bSELECT\s+\*)'
+        r'|(?P<select_kw>\bSELECT\b)'
+        r'|(?P<like_wildcard>(?-i:\bLIKE\b)\s*[\'"]\s*%)'
+        r'|(?P<join_count>\bJOIN\b)'
+        r'|(?P<distinct>\bDISTINCT\b)'
+        r'|(?P<order_by>\bORDER\s+BY\b)'
+        r'|(?P<insert_into>\bINSERT\s+INTO\b)'
+        r'|(?P<group_by>\bGROUP\s+BY\b)'
+        r'|(?P<index_hint>\bUSE\s+INDEX\b|\bFORCE\s+INDEX\b)',
+        re.IGNORECASE
+    )
+
+    # 各模式对应的 (问题, 建议) 文案，模块加载时构建一次，分析时直接查表
+    PATTERN_MESSAGES = {
+        'select_star': ("❌ 使用 SELECT * 会检索所有列，建议明确指定需要的列",
+                        "明确列名优化: 只选择需要的列以减少数据传输"),
+        'missing_where': ("❌ 缺少 WHERE 子句可能导致全表扫描",
+                          "添加过滤条件: 使用WHERE子句限制扫描范围"),
+        'or_condition': ("⚠️  OR 条件可能无法有效使用索引",
+                         "OR条件优化: 考虑使用UNION或IN子句替代"),
+        'like_wildcard': ("❌ LIKE 前置通配符无法使用索引",
+                          "模糊查询优化: 改为后置通配符或使用全文搜索"),
+        'subquery': ("💡 存在子查询，考虑是否可以用 JOIN 优化",
+                     "子查询优化: 考虑将相关子查询改为JOIN"),
+        'distinct': ("💡 使用 DISTINCT 可能影响性能",
+                     "DISTINCT优化: 检查是否必要，或使用GROUP BY替代"),
+        'order_by': ("💡 ORDER BY 操作需要排序，确保相关列有索引",
+                     "排序优化: 确保ORDER BY列有适当索引"),
+    }
 
-    @lru_cache(maxsize=128)
-    def _cached_pattern_analysis(self, sql_hash: str, patterns_key: str) -> Tuple:
-        """缓存模式分析结果"""
-        return ()
+    # 快速改写规则使用的模式
+    WHITESPACE_PATTERN = re.compile(r'\s+')
+    FROM_TABLE_PATTERN = re.compile(r'FROM\s+(\w+)', re.IGNORECASE)
+    FAST_REWRITE_PATTERN = re.compile(r'(?P<select_star>SELECT\s+\*)|(?P<group_by>GROUP\s+BY)', re.IGNORECASE)
 
-    def analyze_fast(self, sql_query: str) -> SQLAnalysisResult:
-        """快速SQL分析 - 优化版本"""
-        start_time = time.time()
+    # 分析结果 LRU 缓存容量 (按 SQL 指纹缓存)
+    CACHE_SIZE = 256
 
-        # 检查缓存
-        sql_hash = self._get_sql_hash(sql_query)
-        if sql_hash in self.cache:
-            self.hit_count += 1
-            cached_result = self.cache[sql_hash]
-            cached_result.processing_time = time.time() - start_time
-            return cached_result
+    def __init__(self):
+        # functools.lru_cache: C 实现的真 LRU，线程安全，命中/未命中统计由 cache_info() 提供
+        self._analyze_cached = lru_cache(maxsize=self.CACHE_SIZE)(self._analyze_fingerprint)
+
+    # 字面量参数化: 字符串/数字常量替换为占位符，前置 % 通配符保留以免影响 LIKE 检测
+    LITERAL_PATTERN = re.compile(r"'(\s*%)?[^']*'|\b\d+\b")
+
+    def _get_sql_fingerprint(self, sql_query: str) -> str:
+        """生成SQL指纹用于缓存 (空白折叠 + 字面量参数化，仅字面量不同的查询共享分析结果)"""
+        normalized_sql = self.WHITESPACE_PATTERN.sub(' ', sql_query.strip())
+        return self.LITERAL_PATTERN.sub(
+            lambda m: "'%?'" if m.group(1) else '?',
+            normalized_sql
+        )
 
-        self.miss_count += 1
+    def _scan_keywords(self, sql_query: str) -> Counter:
+        """单遍扫描 SQL，统计各关键字模式的出现次数"""
+        return Counter(match.lastgroup for match in self.KEYWORD_SCANNER.finditer(sql_query))
 
-        # 并行分析多个模式
+    def analyze_fast(self, sql_query: str) -> SQLAnalysisResult:
+        """快速SQL分析 - 优化版本 (按指纹走 LRU 缓存)"""
+        start_time = time.perf_counter()
+        cached_result = self._analyze_cached(self._get_sql_fingerprint(sql_query))
+        # 缓存中的结果被并发调用方共享，耗时写在副本上，避免相互覆盖
+        return replace(cached_result, processing_time=time.perf_counter() - start_time)
+
+    def _analyze_fingerprint(self, fingerprint: str) -> SQLAnalysisResult:
+        """对 SQL 指纹执行模式分析 (结果只取决于指纹，可安全缓存)"""
         issues = []
         suggestions = []
         metrics = {
@@ -111,105 +223,89 @@ class SQLAnalyzer:
             'has_index_hint': False
         }
 
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # 提交并行分析任务
-            futures = {
-                executor.submit(self._analyze_pattern, sql_query, pattern_name): pattern_name
-                for pattern_name in self.PATTERNS.keys()
-            }
+        # 关键字计数只扫描一次，由各模式分析共享
+        keyword_counts = self._scan_keywords(fingerprint)
 
-            # 收集结果
-            for future in as_completed(futures):
-                pattern_name = futures[future]
-                try:
-                    result = future.result(timeout=0.1)  # 快速超时
-                    if result:
-                        issues.extend(result.get('issues', []))
-                        suggestions.extend(result.get('suggestions', []))
-                        if 'metrics' in result:
-                            metrics.update(result['metrics'])
-                except Exception:
-                    continue  # 忽略单个模式分析失败
-
-        # 缓存结果
-        analysis_result = SQLAnalysisResult(
-            issues=list(set(issues)),  # 去重
-            suggestions=list(set(suggestions)),  # 去重
+        # 各模式均为微秒级的预编译正则匹配，直接顺序执行，避免线程池提交/等待的开销
+        for pattern_name in self.PATTERNS:
+            result = self._analyze_pattern(fingerprint, pattern_name, keyword_counts)
+            if result:
+                issues.extend(result['issues'])
+                suggestions.extend(result['suggestions'])
+                metrics.update(result['metrics'])
+
+        return SQLAnalysisResult(
+            issues=list(dict.fromkeys(issues)),  # 保序去重
+            suggestions=list(dict.fromkeys(suggestions)),
             metrics=metrics,
-            processing_time=time.time() - start_time
+            processing_time=0.0
         )
 
-        # 限制缓存大小
-        if len(self.cache) > 100:
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
-
-        self.cache[sql_hash] = analysis_result
-        return analysis_result
-
-    def _analyze_pattern(self, sql_query: str, pattern_name: str) -> Dict[str, Any]:
-        """分析单个模式"""
-        sql_lower = sql_query.lower()
+    def _analyze_pattern(self, sql_query: str, pattern_name: str, keyword_counts: Counter) -> Dict[str, Any]:
+        """分析单个模式 (关键字类模式直接读取 keyword_counts)"""
         pattern = self.PATTERNS[pattern_name]
 
         result = {'issues': [], 'suggestions': [], 'metrics': {}}
+        issue, suggestion = self.PATTERN_MESSAGES.get(pattern_name, (None, None))
 
-        if pattern_name == 'select_star' and pattern.search(sql_query):
-            result['issues'].append("❌ 使用 SELECT * 会检索所有列，建议明确指定需要的列")
-            result['suggestions'].append("明确列名优化: 只选择需要的列以减少数据传输")
+        if pattern_name == 'select_star' and keyword_counts['select_star']:
+            result['issues'].append(issue)
+            result['suggestions'].append(suggestion)
             result['metrics']['select_star'] = True
 
         elif pattern_name == 'missing_where':
             # 更精确的WHERE子句检测
-            if pattern.search(sql_query) and not re.search(r'\bINSERT\s+INTO\b', sql_query, re.IGNORECASE):
-                result['issues'].append("❌ 缺少 WHERE 子句可能导致全表扫描")
-                result['suggestions'].append("添加过滤条件: 使用WHERE子句限制扫描范围")
+            if pattern.search(sql_query) and not keyword_counts['insert_into']:
+                result['issues'].append(issue)
+                result['suggestions'].append(suggestion)
                 result['metrics']['missing_where'] = True
 
         elif pattern_name == 'join_count':
-            joins = pattern.findall(sql_query)
-            if len(joins) > 3:
-                result['issues'].append(f"⚠️  发现 {len(joins)} 个 JOIN，可能影响性能")
+            joins = keyword_counts['join_count']
+            if joins > 3:
+                result['issues'].append(f"⚠️  发现 {joins} 个 JOIN，可能影响性能")
                 result['suggestions'].append("优化多表关联: 考虑使用CTE或分解复杂查询")
-            result['metrics']['joins'] = len(joins)
+            result['metrics']['joins'] = joins
 
         elif pattern_name == 'or_condition' and pattern.search(sql_query):
-            result['issues'].append("⚠️  OR 条件可能无法有效使用索引")
-            result['suggestions'].append("OR条件优化: 考虑使用UNION或IN子句替代")
+            result['issues'].append(issue)
+            result['suggestions'].append(suggestion)
 
-        elif pattern_name == 'like_wildcard' and pattern.search(sql_query):
-            result['issues'].append("❌ LIKE 前置通配符无法使用索引")
-            result['suggestions'].append("模糊查询优化: 改为后置通配符或使用全文搜索")
+        elif pattern_name == 'like_wildcard' and keyword_counts['like_wildcard']:
+            result['issues'].append(issue)
+            result['suggestions'].append(suggestion)
 
         elif pattern_name == 'subquery':
-            subqueries = pattern.findall(sql_query)
-            if len(subqueries) > 1:
-                result['issues'].append("💡 存在多个子查询，考虑是否可以用 JOIN 优化")
-                result['suggestions'].append("子查询优化: 考虑将相关子查询改为JOIN")
-            result['metrics']['subqueries'] = len(subqueries) - 1
-
-        elif pattern_name == 'distinct' and pattern.search(sql_query):
-            result['issues'].append("💡 使用 DISTINCT 可能影响性能")
-            result['suggestions'].append("DISTINCT优化: 检查是否必要，或使用GROUP BY替代")
-
-        elif pattern_name == 'order_by' and pattern.search(sql_query):
-            result['issues'].append("💡 ORDER BY 操作需要排序，确保相关列有索引")
-            result['suggestions'].append("排序优化: 确保ORDER BY列有适当索引")
-
-        elif pattern_name == 'index_hint' and pattern.search(sql_query):
+            # 除最外层外的每个 SELECT 计为一个子查询
+            subqueries = max(keyword_counts['select_star'] + keyword_counts['select_kw'] - 1, 0)
+            if subqueries > 0:
+                result['issues'].append(issue)
+                result['suggestions'].append(suggestion)
+            result['metrics']['subqueries'] = subqueries
+
+        elif pattern_name == 'distinct' and keyword_counts['distinct']:
+            result['issues'].append(issue)
+            result['suggestions'].append(suggestion)
+
+        elif pattern_name == 'order_by' and keyword_counts['order_by']:
+            result['issues'].append(issue)
+            result['suggestions'].append(suggestion)
+
+        elif pattern_name == 'index_hint' and keyword_counts['index_hint']:
             result['metrics']['has_index_hint'] = True
 
         return result
 
     def get_cache_stats(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
-        total_requests = self.hit_count + self.miss_count
-        hit_rate = (self.hit_count / total_requests * 100) if total_requests > 0 else 0
+        info = self._analyze_cached.cache_info()
+        total_requests = info.hits + info.misses
+        hit_rate = (info.hits / total_requests * 100) if total_requests > 0 else 0
         return {
-            'hit_count': self.hit_count,
-            'miss_count': self.miss_count,
+            'hit_count': info.hits,
+            'miss_count': info.misses,
             'hit_rate': f"{hit_rate:.1f}%",
-            'cache_size': len(self.cache)
+            'cache_size': info.currsize
         }
 
 # 全局分析器实例
@@ -219,7 +315,6 @@ sql_analyzer = SQLAnalyzer()
 # 1. CrewAI SQL 优化 Agent (完整实现)
 # ============================================================================
 
-@tool("SQL Analysis Tool")
 def analyze_sql_tool(sql_query: str) -> str:
     """高性能 SQL 语句分析工具，识别性能问题和优化机会
 
@@ -235,26 +330,27 @@ def analyze_sql_tool(sql_query: str) -> str:
     if not analysis_result.issues:
         return f"✅ SQL 语句看起来不错，没有明显的性能问题 (分析耗时: {analysis_result.processing_time:.3f}s)"
 
-    issues_text = "发现以下问题:\n" + "\n".join(analysis_result.issues)
+    # 各片段收集到列表中，最后一次 join
+    parts = ["发现以下问题:\n", "\n".join(analysis_result.issues)]
 
-    # 添加性能指标
-    if analysis_result.metrics:
-        metrics_summary = f"\n\n📊 性能指标:\n"
-        if analysis_result.metrics.get('joins', 0) > 0:
-            metrics_summary += f"   • JOIN 数量: {analysis_result.metrics['joins']}\n"
-        if analysis_result.metrics.get('subqueries', 0) > 0:
-            metrics_summary += f"   • 子查询数量: {analysis_result.metrics['subqueries']}\n"
-        if analysis_result.metrics.get('select_star', False):
-            metrics_summary += f"   • 使用了 SELECT *\n"
-        if analysis_result.metrics.get('missing_where', False):
-            metrics_summary += f"   • 缺少 WHERE 子句\n"
-
-        issues_text += metrics_summary
+    # 添加性能指标 (指标只读取一次)
+    metrics = analysis_result.metrics
+    if metrics:
+        joins = metrics.get('joins', 0)
+        subqueries = metrics.get('subqueries', 0)
+        parts.append("\n\n📊 性能指标:\n")
+        if joins > 0:
+            parts.append(f"   • JOIN 数量: {joins}\n")
+        if subqueries > 0:
+            parts.append(f"   • 子查询数量: {subqueries}\n")
+        if metrics.get('select_star', False):
+            parts.append("   • 使用了 SELECT *\n")
+        if metrics.get('missing_where', False):
+            parts.append("   • 缺少 WHERE 子句\n")
 
-    issues_text += f"\n\n⚡ 分析耗时: {analysis_result.processing_time:.3f}s"
-    return issues_text
+    parts.append(f"\n\n⚡ 分析耗时: {analysis_result.processing_time:.3f}s")
+    return "".join(parts)
 
-@tool("SQL Optimization Tool")
 def generate_optimization_suggestions(sql_query: str) -> str:
     """根据 SQL 分析结果生成具体的优化建议
 
@@ -272,10 +368,13 @@ def generate_optimization_suggestions(sql_query: str) -> str:
 
     suggestions = []
 
-    # 根据分析结果生成详细建议
+    # 根据分析结果生成详细建议 (指标只读取一次)
     metrics = analysis_result.metrics
+    select_star = metrics.get('select_star', False)
+    missing_where = metrics.get('missing_where', False)
+    joins = metrics.get('joins', 0)
 
-    if metrics.get('select_star', False):
+    if select_star:
         suggestions.append(f"""
 优化建议 1: 明确列名
 - 问题: SELECT * 检索所有列，增加网络传输和内存消耗
@@ -284,7 +383,7 @@ def generate_optimization_suggestions(sql_query: str) -> str:
 - 预期收益: 减少30-70%数据传输量，提升查询速度
         """)
 
-    if metrics.get('missing_where', False):
+    if missing_where:
         suggestions.append(f"""
 优化建议 2: 添加过滤条件
 - 问题: 缺少 WHERE 子句导致全表扫描
@@ -293,12 +392,22 @@ def generate_optimization_suggestions(sql_query: str) -> str:
 - 预期收益: 减少90%+扫描行数，避免全表锁定
         """)
 
-    if analysis_result.issues:
-        for issue in analysis_result.issues:
-            if "JOIN" in issue:
-                suggestions.append(f"""
+    # 单次遍历问题列表，标记需要生成的建议类型
+    has_join = has_or = has_bad_like = False
+    for issue in analysis_result.issues:
+        if not has_join and "JOIN" in issue:
+            has_join = True
+        if not has_or and "OR" in issue:
+            has_or = True
+        if not has_bad_like and "LIKE" in issue and "%" in issue:
+            has_bad_like = True
+        if has_join and has_or and has_bad_like:
+            break
+
+    if has_join:
+        suggestions.append(f"""
 优化建议 3: 优化多表关联
-- 问题: {analysis_result.metrics.get('joins', 0)} 个 JOIN 操作可能导致笛卡尔积
+- 问题: {joins} 个 JOIN 操作可能导致笛卡尔积
 - 方案:
   * 使用覆盖索引优化连接条件
   * 考虑使用 CTE 分步处理复杂关联
@@ -314,11 +423,9 @@ def generate_optimization_suggestions(sql_query: str) -> str:
   INNER JOIN filtered_data fd ON u.id = fd.user_id
 - 预期收益: 减少50-80%的连接计算开销
                 """)
-                break
 
-    for issue in analysis_result.issues:
-        if "OR" in issue:
-            suggestions.append(f"""
+    if has_or:
+        suggestions.append(f"""
 优化建议 4: 优化 OR 条件
 - 问题: OR 条件可能无法有效使用索引
 - 方案:
@@ -328,11 +435,9 @@ def generate_optimization_suggestions(sql_query: str) -> str:
 - 示例: SELECT * FROM users WHERE status IN ('active', 'pending')
 - 预期收益: 提升20-60%查询性能
             """)
-            break
 
-    for issue in analysis_result.issues:
-        if "LIKE" in issue and "%" in issue:
-            suggestions.append(f"""
+    if has_bad_like:
+        suggestions.append(f"""
 优化建议 5: 优化模糊查询
 - 问题: 前置通配符导致全表扫描
 - 方案:
@@ -341,7 +446,6 @@ def generate_optimization_suggestions(sql_query: str) -> str:
   * 使用外部搜索引擎: Elasticsearch/Solr
 - 预期收益: 提升10-100倍搜索性能
             """)
-            break
 
     # 如果没有生成具体建议，使用通用建议
     if not suggestions:
@@ -353,34 +457,117 @@ def generate_optimization_suggestions(sql_query: str) -> str:
 - 监控查询执行时间和资源消耗
         """]
 
-    result = "\n".join(suggestions)
-    result += f"\n\n⚡ 分析引擎性能: {analysis_result.processing_time:.3f}s"
-
-    # 添加缓存统计
+    # 分析耗时与缓存统计作为最后一段，与建议一起一次 join
     cache_stats = sql_analyzer.get_cache_stats()
-    result += f" | 缓存命中率: {cache_stats['hit_rate']}"
+    suggestions.append(f"\n⚡ 分析引擎性能: {analysis_result.processing_time:.3f}s | 缓存命中率: {cache_stats['hit_rate']}")
+    return "\n".join(suggestions)
+
+
+# 综合优化任务描述模板 (模块加载时构建一次，每次请求只替换 SQL)
+OPTIMIZATION_TASK_TEMPLATE = Template("""
+            请对以下 SQL 语句进行完整的性能优化分析:
+
+            ```sql
+            $sql_query
+            ```
+
+            请使用提供的工具完成以下全流程分析:
 
-    return result
+            **第一阶段: SQL 分析**
+            - 使用 SQL Analysis Tool 分析语句中的性能问题
+            - 识别索引使用情况、查询效率、潜在瓶颈
+            - 列出所有发现的问题并标注严重程度
+
+            **第二阶段: 优化设计**
+            - 使用 SQL Optimization Tool 生成具体的优化建议
+            - 设计优化后的 SQL 语句
+            - 评估预期的性能提升和实施注意事项
+
+            **第三阶段: 报告生成**
+            整合所有分析结果，生成包含以下内容的完整报告:
+            1. 原始 SQL 和优化后的 SQL 对比
+            2. 发现的问题列表
+            3. 优化措施详解
+            4. 预期性能提升
+            5. 实施建议
+
+            **输出格式要求:**
+            - 使用 JSON 格式输出最终结果
+            - 结构清晰，易于解析
+            - 包含所有关键信息
+
+            **JSON 结构示例:**
+            {
+                "original_sql": "原始 SQL",
+                "optimized_sql": "优化后的 SQL",
+                "issues_found": ["问题1", "问题2"],
+                "optimizations_applied": ["优化1", "优化2"],
+                "performance_gain_estimate": "预估提升百分比",
+                "recommendations": ["建议1", "建议2"]
+            }
+
+            **工作原则:**
+            - 保持 SQL 语义不变
+            - 优先考虑性能提升
+            - 兼顾代码可读性和可维护性
+            - 提供符合业界标准的优化建议
+            """)
+
+
+@lru_cache(maxsize=1)
+def get_crewai_tools() -> Tuple:
+    """包装 CrewAI 工具 (首次进入 LLM 模式时才导入 CrewAI，快速模式无需加载)"""
+    from crewai.tools import tool
+
+    return (
+        tool("SQL Analysis Tool")(analyze_sql_tool),
+        tool("SQL Optimization Tool")(generate_optimization_suggestions),
+    )
+
+
+@lru_cache(maxsize=4)
+def get_llm_client(api_key: str, base_url: Optional[str]):
+    """获取 CrewAI LLM 客户端 (按 api_key/base_url 缓存，多个优化器实例共享同一个客户端)"""
+    from crewai import LLM
+
+    return LLM(
+        model="mistral:latest",  # 使用Ollama服务器上的实际模型名称
+        temperature=0.1,  # 低温度以确保准确性
+        api_key=api_key,
+        base_url=base_url
+    )
 
 
 class SQLOptimizerSingle:
     """高性能单 Agent SQL 优化系统"""
-    def __init__(self, openai_api_key: Optional[str] = None, use_fast_mode: bool = True):
-        self.api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
-        self.base_url = os.getenv("OPENAI_BASE_URL")
+
+    # 快速优化结果 LRU 缓存容量
+    FAST_RESULT_CACHE_SIZE = 1024
+
+    def __init__(self, openai_api_key: Optional[str] = None, use_fast_mode: bool = True, debug: bool = False):
+        self.api_key = openai_api_key or OPENAI_API_KEY
+        self.base_url = OPENAI_BASE_URL
         self.use_fast_mode = use_fast_mode  # 快速模式：跳过LLM，使用本地分析
+        self.debug = debug  # 调试模式：开启 CrewAI verbose 输出
 
         if not self.api_key:
             raise ValueError("需要设置 OPENAI_API_KEY 环境变量")
 
-        self._setup_llm()
-        self._setup_agent()
+        # CrewAI LLM 与 Agent 延迟到首次 LLM 模式请求时初始化
+        self.llm = None
+        self.sql_expert = None
+        self._crewai_ready = False
+        self._crewai_lock = threading.Lock()
+
+        # 快速优化结果缓存 (按原始 SQL，优化后的 SQL 基于原文改写，不能按指纹共享)
+        self._fast_optimize_cached = lru_cache(maxsize=self.FAST_RESULT_CACHE_SIZE)(self._fast_optimize)
 
         # 性能统计
         self.stats = {
             'total_requests': 0,
             'fast_mode_hits': 0,
             'llm_mode_hits': 0,
+            'llm_bypass_hits': 0,  # 简单 SQL 跳过 LLM 的次数
             'total_processing_time': 0.0,
             'avg_processing_time': 0.0
         }
@@ -388,30 +575,41 @@ class SQLOptimizerSingle:
     def _setup_llm(self):
         """设置 LLM 配置"""
         try:
-            # 尝试导入 LLM
-            from crewai import LLM
-
-            # 配置 LLM
-            self.llm = LLM(
-                model="mistral:latest",  # 使用Ollama服务器上的实际模型名称
-                temperature=0.1,  # 低温度以确保准确性
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
-            print("✅ LLM 配置成功")
+            # 复用已创建的 LLM 客户端
+            self.llm = get_llm_client(self.api_key, self.base_url)
+            logger.debug("✅ LLM 配置成功")
         except ImportError:
-            print("⚠️  无法导入 LLM，使用默认配置")
+            logger.warning("⚠️  无法导入 LLM，使用默认配置")
             self.llm = None
         except Exception as e:
-            print(f"⚠️  LLM 配置失败，将使用备用方案: {e}")
+            logger.warning("⚠️  LLM 配置失败，将使用备用方案: %s", e)
             self.llm = None
 
+    def _ensure_crewai(self) -> bool:
+        """按需初始化 CrewAI LLM 与 Agent，返回 LLM 模式是否可用"""
+        if not self._crewai_ready:
+            # 加锁初始化，并发的首批 LLM 请求等待初始化完成，而不是看到未就绪的 Agent 后回退到快速模式
+            with self._crewai_lock:
+                if not self._crewai_ready:
+                    self._setup_llm()
+                    if self.llm:
+                        self._setup_agent()
+                    self._crewai_ready = True
+        return self.sql_expert is not None
+
+    def warm_up(self) -> bool:
+        """预热：非快速模式下提前初始化 CrewAI LLM 与 Agent，首个 LLM 请求无需承担导入与客户端创建开销"""
+        if self.use_fast_mode:
+            return False
+        return self._ensure_crewai()
+
     def _setup_agent(self):
         """初始化单一综合 SQL Agent"""
+        from crewai import Agent
 
         # 综一的 agent 配置参数
         agent_config = {
-            'verbose': True,
+            'verbose': self.debug,
             'allow_delegation': False,
             'llm': self.llm
         }
@@ -442,16 +640,17 @@ class SQLOptimizerSingle:
             - 提供详细的优化报告
 
             你的分析总是全面、准确、有理有据，优化方案兼顾性能和可读性。""",
-            tools=[analyze_sql_tool, generate_optimization_suggestions],
+            tools=list(get_crewai_tools()),
             **agent_config
         )
     
-    def _fast_optimize(self, sql_query: str) -> Dict[str, Any]:
-        """快速优化模式 - 直接使用高性能分析器，无需LLM"""
-        start_time = time.time()
+    def _fast_optimize(self, sql_query: str, analysis_result: Optional[SQLAnalysisResult] = None) -> Dict[str, Any]:
+        """快速优化模式 - 直接使用高性能分析器，无需LLM (可复用调用方已有的分析结果)"""
+        start_time = time.perf_counter()
 
         # 使用高性能分析器
-        analysis_result = sql_analyzer.analyze_fast(sql_query)
+        if analysis_result is None:
+            analysis_result = sql_analyzer.analyze_fast(sql_query)
 
         # 生成优化后的SQL
         optimized_sql = self._apply_fast_optimizations(sql_query, analysis_result)
@@ -462,64 +661,55 @@ class SQLOptimizerSingle:
         # 生成建议
         recommendations = self._generate_recommendations(analysis_result)
 
-        processing_time = time.time() - start_time
+        processing_time = time.perf_counter() - start_time
 
+        # 分析结果来自按指纹共享的 LRU 缓存，列表与字典复制后再放入结果，调用方修改结果不会污染缓存
         return {
             "original_sql": sql_query,
             "optimized_sql": optimized_sql,
-            "issues_found": analysis_result.issues,
-            "optimizations_applied": analysis_result.suggestions,
+            "issues_found": list(analysis_result.issues),
+            "optimizations_applied": list(analysis_result.suggestions),
             "performance_gain_estimate": performance_gain,
             "recommendations": recommendations,
             "processing_mode": "fast",
             "processing_time": processing_time,
-            "analysis_metrics": analysis_result.metrics
+            "analysis_metrics": dict(analysis_result.metrics)
         }
 
     def _apply_fast_optimizations(self, sql_query: str, analysis_result: SQLAnalysisResult) -> str:
-        """应用快速优化规则"""
-        optimized = sql_query
-
-        # 如果SELECT *，优化为具体列（需要根据上下文推断）
-        if analysis_result.metrics.get('select_star', False):
-            # 简单的启发式优化：如果有表名，假设主键列
-            table_match = re.search(r'FROM\s+(\w+)', sql_query, re.IGNORECASE)
-            if table_match:
-                table_name = table_match.group(1)
-                optimized = re.sub(
-                    r'SELECT\s+\*',
-                    f'SELECT id, name, created_at',  # 通用列名
-                    optimized,
-                    flags=re.IGNORECASE
-                )
-
-        # 如果没有WHERE且是SELECT查询，添加基本过滤
-        if analysis_result.metrics.get('missing_where', False):
-            # 为INSERT查询跳过WHERE优化
-            if not re.search(r'\bINSERT\s+INTO\b', optimized, re.IGNORECASE):
-                table_match = re.search(r'FROM\s+(\w+)', optimized, re.IGNORECASE)
-                if table_match:
-                    # 在GROUP BY之前添加WHERE
-                    optimized = re.sub(
-                        r'(GROUP\s+BY)',
-                        'WHERE status = \'active\' AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY) \\1',
-                        optimized,
-                        flags=re.IGNORECASE
-                    )
-
-        return optimized
+        """应用快速优化规则 (SELECT * 与 GROUP BY 前置 WHERE 两类改写在一次正则替换中完成)"""
+        # 两类改写都要求存在 FROM 表
+        if not sql_analyzer.FROM_TABLE_PATTERN.search(sql_query):
+            return sql_query
+
+        # 如果SELECT *，优化为具体列（简单的启发式优化：假设通用列名）
+        rewrite_select_star = analysis_result.metrics.get('select_star', False)
+        # 如果没有WHERE且是SELECT查询，在GROUP BY之前添加基本过滤（missing_where 已排除 INSERT 查询）
+        rewrite_group_by = analysis_result.metrics.get('missing_where', False)
+        if not (rewrite_select_star or rewrite_group_by):
+            return sql_query
+
+        def _rewrite(match: re.Match) -> str:
+            if match.lastgroup == 'select_star':
+                return 'SELECT id, name, created_at' if rewrite_select_star else match.group(0)
+            if rewrite_group_by:
+                return f"WHERE status = 'active' AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY) {match.group(0)}"
+            return match.group(0)
+
+        return sql_analyzer.FAST_REWRITE_PATTERN.sub(_rewrite, sql_query)
 
     def _estimate_performance_gain(self, analysis_result: SQLAnalysisResult) -> str:
         """估算性能提升"""
         gains = []
+        metrics = analysis_result.metrics
 
-        if analysis_result.metrics.get('select_star', False):
+        if metrics.get('select_star', False):
             gains.append("30-50%")
 
-        if analysis_result.metrics.get('missing_where', False):
+        if metrics.get('missing_where', False):
             gains.append("70-90%")
 
-        if analysis_result.metrics.get('joins', 0) > 3:
+        if metrics.get('joins', 0) > 3:
             gains.append("40-60%")
 
         if any("LIKE" in issue for issue in analysis_result.issues):
@@ -534,14 +724,15 @@ class SQLOptimizerSingle:
     def _generate_recommendations(self, analysis_result: SQLAnalysisResult) -> List[str]:
         """生成优化建议"""
         recommendations = []
+        metrics = analysis_result.metrics
 
-        if analysis_result.metrics.get('select_star', False):
+        if metrics.get('select_star', False):
             recommendations.append("明确指定查询列，避免SELECT *")
 
-        if analysis_result.metrics.get('missing_where', False):
+        if metrics.get('missing_where', False):
             recommendations.append("添加适当的WHERE条件限制扫描范围")
 
-        if analysis_result.metrics.get('joins', 0) > 3:
+        if metrics.get('joins', 0) > 3:
             recommendations.append("考虑使用CTE或分解复杂JOIN操作")
 
         recommendations.extend([
@@ -550,133 +741,118 @@ class SQLOptimizerSingle:
             "监控查询执行性能"
         ])
 
-        return list(set(recommendations))  # 去重
+        return recommendations
+
+    def _should_invoke_llm(self, analysis_result: SQLAnalysisResult) -> bool:
+        """判断是否值得调用 LLM：无 SELECT *、有 WHERE、JOIN 不超过 1 个且无前置通配符的简单 SQL，本地分析已足够"""
+        metrics = analysis_result.metrics
+        return (
+            metrics.get('select_star', False)
+            or metrics.get('missing_where', False)
+            or metrics.get('joins', 0) > 1
+            or sql_analyzer.PATTERN_MESSAGES['like_wildcard'][0] in analysis_result.issues
+        )
 
     def optimize_sql(self, sql_query: str, force_llm: bool = False) -> Dict[str, Any]:
         """执行 SQL 优化流程 - 优化版本"""
-        start_time = time.time()
+        start_time = time.perf_counter()
         self.stats['total_requests'] += 1
 
-        print("\n" + "="*80)
-        print("🚀 高性能 SQL 优化流程启动")
-        print("="*80)
+        logger.debug("🚀 高性能 SQL 优化流程启动")
 
-        # 快速模式决策
-        if self.use_fast_mode and not force_llm:
-            print("⚡ 使用快速优化模式 (本地分析引擎)")
-            self.stats['fast_mode_hits'] += 1
-            result = self._fast_optimize(sql_query)
+        # 快速模式决策 (非快速模式下需要分析结果判断是否值得调用 LLM，简单 SQL 同样跳过 LLM)
+        # 本次请求最多分析一次，LLM 及回退路径共享同一分析结果
+        analysis_result = None
+        if self.use_fast_mode:
+            use_fast_path = True
+        else:
+            analysis_result = sql_analyzer.analyze_fast(sql_query)
+            use_fast_path = not self._should_invoke_llm(analysis_result)
 
-            # 添加元数据
-            result.update({
-                "timestamp": datetime.now().isoformat(),
+        if use_fast_path and not force_llm:
+            logger.debug("⚡ 使用快速优化模式 (本地分析引擎)")
+            self.stats['fast_mode_hits'] += 1
+            if not self.use_fast_mode:
+                self.stats['llm_bypass_hits'] += 1
+
+            # 快速模式下结果按 SQL 缓存；跳过 LLM 时已有分析结果，直接复用，不再重复分析
+            # 缓存结果的列表与字典字段复制后与本次请求的元数据合并返回，缓存中的结果不被修改
+            if analysis_result is None:
+                cached_result = self._fast_optimize_cached(sql_query)
+                fast_result = {
+                    **cached_result,
+                    "issues_found": list(cached_result["issues_found"]),
+                    "optimizations_applied": list(cached_result["optimizations_applied"]),
+                    "recommendations": list(cached_result["recommendations"]),
+                    "analysis_metrics": dict(cached_result["analysis_metrics"])
+                }
+            else:
+                fast_result = self._fast_optimize(sql_query, analysis_result)
+            processing_time = time.perf_counter() - start_time
+            result = {
+                **fast_result,
+                "timestamp": time.time(),  # epoch 秒，展示时再格式化
                 "agent": "fast_sql_optimizer",
+                "processing_time": processing_time,
                 "cache_stats": sql_analyzer.get_cache_stats()
-            })
+            }
 
-            processing_time = time.time() - start_time
             self.stats['total_processing_time'] += processing_time
             self.stats['avg_processing_time'] = self.stats['total_processing_time'] / self.stats['total_requests']
 
-            print(f"✅ 快速优化完成 (耗时: {processing_time:.3f}s)")
+            logger.debug("✅ 快速优化完成 (耗时: %.3fs)", processing_time)
             return result
 
         # LLM模式 - 原有逻辑优化
-        print("🧠 使用 CrewAI 深度分析模式")
+        logger.debug("🧠 使用 CrewAI 深度分析模式")
         self.stats['llm_mode_hits'] += 1
 
-        # 单一综合任务：完整的 SQL 优化分析
-        comprehensive_task = Task(
-            description=f"""
-            请对以下 SQL 语句进行完整的性能优化分析:
-
-            ```sql
-            {sql_query}
-            ```
-
-            请使用提供的工具完成以下全流程分析:
-
-            **第一阶段: SQL 分析**
-            - 使用 SQL Analysis Tool 分析语句中的性能问题
-            - 识别索引使用情况、查询效率、潜在瓶颈
-            - 列出所有发现的问题并标注严重程度
-
-            **第二阶段: 优化设计**
-            - 使用 SQL Optimization Tool 生成具体的优化建议
-            - 设计优化后的 SQL 语句
-            - 评估预期的性能提升和实施注意事项
-
-            **第三阶段: 报告生成**
-            整合所有分析结果，生成包含以下内容的完整报告:
-            1. 原始 SQL 和优化后的 SQL 对比
-            2. 发现的问题列表
-            3. 优化措施详解
-            4. 预期性能提升
-            5. 实施建议
+        if analysis_result is None:
+            analysis_result = sql_analyzer.analyze_fast(sql_query)
 
-            **输出格式要求:**
-            - 使用 JSON 格式输出最终结果
-            - 结构清晰，易于解析
-            - 包含所有关键信息
+        # 检查是否有有效的 LLM 配置
+        if not self._ensure_crewai():
+            logger.warning("⚠️ LLM 配置失败，切换到快速模式")
+            return self._fast_optimize(sql_query, analysis_result)
 
-            **JSON 结构示例:**
-            {{
-                "original_sql": "原始 SQL",
-                "optimized_sql": "优化后的 SQL",
-                "issues_found": ["问题1", "问题2"],
-                "optimizations_applied": ["优化1", "优化2"],
-                "performance_gain_estimate": "预估提升百分比",
-                "recommendations": ["建议1", "建议2"]
-            }}
+        from crewai import Task, Crew, Process
 
-            **工作原则:**
-            - 保持 SQL 语义不变
-            - 优先考虑性能提升
-            - 兼顾代码可读性和可维护性
-            - 提供符合业界标准的优化建议
-            """,
+        # 单一综合任务：完整的 SQL 优化分析
+        comprehensive_task = Task(
+            description=OPTIMIZATION_TASK_TEMPLATE.substitute(sql_query=sql_query),
             agent=self.sql_expert,
             expected_output="JSON 格式的完整 SQL 优化报告，包含分析、优化和建议"
         )
 
-        # 检查是否有有效的 LLM 配置
-        if not self.llm:
-            print("⚠️ LLM 配置失败，切换到快速模式")
-            return self._fast_optimize(sql_query)
-
         # 创建 Crew 并执行 (单 Agent 模式)
         crew = Crew(
             agents=[self.sql_expert],
             tasks=[comprehensive_task],
             process=Process.sequential,
-            verbose=True
+            verbose=self.debug
         )
 
         try:
-            print("🚀 开始执行 CrewAI 任务...")
+            logger.debug("🚀 开始执行 CrewAI 任务...")
             # 执行任务
             result = crew.kickoff()
-            print(f"🎯 CrewAI 执行完成，结果类型: {type(result)}")
+            logger.debug("🎯 CrewAI 执行完成，结果类型: %s", type(result))
 
             # 解析结果
             result_str = str(result)
-            print(f"📄 结果字符串长度: {len(result_str)}")
+            logger.debug("📄 结果字符串长度: %d", len(result_str))
 
             # 尝试提取 JSON
-            json_start = result_str.find('{')
-            json_end = result_str.rfind('}') + 1
-
-            if json_start != -1 and json_end > json_start:
-                json_str = result_str[json_start:json_end]
-                print(f"🔍 提取的 JSON 长度: {len(json_str)}")
-                parsed_result = json.loads(json_str)
-                print("✅ JSON 解析成功")
+            parsed_result = extract_first_json(result_str)
+
+            if parsed_result is not None:
+                logger.debug("✅ JSON 解析成功")
             else:
-                print("⚠️  未找到完整 JSON")
+                logger.warning("⚠️  未找到完整 JSON")
                 # 如果没有找到JSON，创建基本结果
                 parsed_result = {
                     "original_sql": sql_query,
-                    "optimized_sql": self._apply_fast_optimizations(sql_query, sql_analyzer.analyze_fast(sql_query)),
+                    "optimized_sql": self._apply_fast_optimizations(sql_query, analysis_result),
                     "issues_found": ["需要详细分析"],
                     "optimizations_applied": ["基础优化"],
                     "performance_gain_estimate": "10-20%",
@@ -684,42 +860,56 @@ class SQLOptimizerSingle:
                 }
 
         except Exception as e:
-            print(f"❌ CrewAI 执行出错: {e}")
-            print("🔄 使用快速优化逻辑")
-            return self._fast_optimize(sql_query)
+            logger.error("❌ CrewAI 执行出错: %s，使用快速优化逻辑", e)
+            return self._fast_optimize(sql_query, analysis_result)
 
         # 确保基本字段存在
         parsed_result = self._ensure_required_fields(parsed_result, sql_query)
 
         # 添加元数据
-        processing_time = time.time() - start_time
+        processing_time = time.perf_counter() - start_time
         self.stats['total_processing_time'] += processing_time
         self.stats['avg_processing_time'] = self.stats['total_processing_time'] / self.stats['total_requests']
 
-        parsed_result.update({
-            "timestamp": datetime.now().isoformat(),
+        parsed_result = {
+            **parsed_result,
+            "timestamp": time.time(),
             "agent": "crewai_sql_optimizer",
             "processing_mode": "llm",
             "processing_time": processing_time,
             "cache_stats": sql_analyzer.get_cache_stats()
-        })
+        }
 
-        print(f"\n✅ CrewAI 优化完成 (耗时: {processing_time:.3f}s)")
+        logger.debug("✅ CrewAI 优化完成 (耗时: %.3fs)", processing_time)
         return parsed_result
 
     def get_performance_stats(self) -> Dict[str, Any]:
         """获取性能统计信息"""
+        fast_cache = self._fast_optimize_cached.cache_info()
         return {
             **self.stats,
+            'fast_cache_hits': fast_cache.hits,
+            'fast_cache_misses': fast_cache.misses,
             'fast_mode_ratio': f"{(self.stats['fast_mode_hits'] / max(self.stats['total_requests'], 1) * 100):.1f}%",
             'llm_mode_ratio': f"{(self.stats['llm_mode_hits'] / max(self.stats['total_requests'], 1) * 100):.1f}%"
         }
+
+
+def with_iso_timestamp(result: Dict[str, Any]) -> Dict[str, Any]:
+    """返回 timestamp 转为 ISO 字符串的结果副本 (优化器内部记录 epoch 秒，对外接口统一使用 ISO 格式)"""
+    timestamp = result.get("timestamp")
+    if not isinstance(timestamp, (int, float)):
+        return result
+    return {**result, "timestamp": datetime.fromtimestamp(timestamp).isoformat()}
   
 
 
 
 # ============================================================================
 
+# 报告分隔线
+REPORT_SEPARATOR = "=" * 80
+
 # ============================================================================
 # 3. 简化主程序
 # ============================================================================
@@ -777,7 +967,7 @@ def main():
         ]
 
         print(f"\n📊 性能测试开始 - 共 {len(test_queries)} 个查询")
-        print("="*80)
+        print(REPORT_SEPARATOR)
 
         total_start_time = time.time()
 
@@ -807,9 +997,9 @@ def main():
         total_time = time.time() - total_start_time
 
         # 显示总体性能统计
-        print("\n" + "="*80)
+        print("\n" + REPORT_SEPARATOR)
         print("📊 性能测试总结")
-        print("="*80)
+        print(REPORT_SEPARATOR)
 
         stats = sql_optimizer.get_performance_stats()
         cache_stats = sql_analyzer.get_cache_stats()
@@ -836,9 +1026,9 @@ def main():
             print(f"\n📋 详细报告示例 ({test_queries[0]['name']}):")
             print_simple_report(fast_result)
 
-        print("\n" + "="*80)
+        print("\n" + REPORT_SEPARATOR)
         print("🎉 高性能 SQL 优化测试完成!")
-        print("="*80)
+        print(REPORT_SEPARATOR)
 
     except Exception as e:
         print(f"\n❌ 错误: {e}")
@@ -847,69 +1037,69 @@ def main():
 
 
 def print_simple_report(result: Dict[str, Any]):
-    """打印优化版报告 - 包含性能信息"""
-
-    print("\n" + "="*80)
-    print("                高性能 SQL 优化报告 v2.0")
-    print("="*80)
-
-    print(f"\n📊 基本信息:")
-    print(f"   处理时间: {result.get('timestamp', 'N/A')}")
-    print(f"   处理模式: {result.get('processing_mode', 'N/A')}")
-    print(f"   处理耗时: {result.get('processing_time', 'N/A')}s")
-    print(f"   Agent: {result.get('agent', 'fast_sql_optimizer')}")
-
-    print(f"\n📝 原始 SQL:")
-    print(result.get('original_sql', 'N/A'))
-
-    print(f"\n✅ 优化后的 SQL:")
-    print(result.get('optimized_sql', 'N/A'))
+    """打印优化版报告 - 包含性能信息 (先拼接完整报告，再一次性写出)"""
+    timestamp = result.get('timestamp')
+    lines = [
+        "",
+        REPORT_SEPARATOR,
+        "                高性能 SQL 优化报告 v2.0",
+        REPORT_SEPARATOR,
+        "",
+        "📊 基本信息:",
+        f"   处理时间: {datetime.fromtimestamp(timestamp).isoformat() if timestamp is not None else 'N/A'}",
+        f"   处理模式: {result.get('processing_mode', 'N/A')}",
+        f"   处理耗时: {result.get('processing_time', 'N/A')}s",
+        f"   Agent: {result.get('agent', 'fast_sql_optimizer')}",
+        "",
+        "📝 原始 SQL:",
+        str(result.get('original_sql', 'N/A')),
+        "",
+        "✅ 优化后的 SQL:",
+        str(result.get('optimized_sql', 'N/A')),
+    ]
 
     issues = result.get('issues_found', [])
     if issues:
-        print(f"\n🔍 发现的问题 ({len(issues)} 个):")
-        for i, issue in enumerate(issues[:5], 1):
-            print(f"   {i}. {issue}")
+        lines.append(f"\n🔍 发现的问题 ({len(issues)} 个):")
+        lines.extend(f"   {i}. {issue}" for i, issue in enumerate(issues[:5], 1))
     else:
-        print(f"\n✅ 未发现明显的性能问题")
+        lines.append("\n✅ 未发现明显的性能问题")
 
     optimizations = result.get('optimizations_applied', [])
     if optimizations:
-        print(f"\n⚡ 应用的优化 ({len(optimizations)} 个):")
-        for i, opt in enumerate(optimizations[:3], 1):
-            print(f"   {i}. {opt}")
+        lines.append(f"\n⚡ 应用的优化 ({len(optimizations)} 个):")
+        lines.extend(f"   {i}. {opt}" for i, opt in enumerate(optimizations[:3], 1))
 
-    print(f"\n📈 预期性能提升: {result.get('performance_gain_estimate', 'N/A')}")
+    lines.append(f"\n📈 预期性能提升: {result.get('performance_gain_estimate', 'N/A')}")
 
     # 性能指标
     metrics = result.get('analysis_metrics', {})
     if metrics:
-        print(f"\n📊 分析指标:")
+        lines.append("\n📊 分析指标:")
         if metrics.get('joins', 0) > 0:
-            print(f"   • JOIN 数量: {metrics['joins']}")
+            lines.append(f"   • JOIN 数量: {metrics['joins']}")
         if metrics.get('subqueries', 0) > 0:
-            print(f"   • 子查询数量: {metrics['subqueries']}")
+            lines.append(f"   • 子查询数量: {metrics['subqueries']}")
         if metrics.get('select_star', False):
-            print(f"   • 使用了 SELECT *")
+            lines.append("   • 使用了 SELECT *")
         if metrics.get('missing_where', False):
-            print(f"   • 缺少 WHERE 子句")
+            lines.append("   • 缺少 WHERE 子句")
 
     # 缓存统计
     cache_stats = result.get('cache_stats', {})
     if cache_stats:
-        print(f"\n💾 缓存信息:")
-        print(f"   • 命中率: {cache_stats.get('hit_rate', 'N/A')}")
-        print(f"   • 缓存大小: {cache_stats.get('cache_size', 'N/A')}")
+        lines.append("\n💾 缓存信息:")
+        lines.append(f"   • 命中率: {cache_stats.get('hit_rate', 'N/A')}")
+        lines.append(f"   • 缓存大小: {cache_stats.get('cache_size', 'N/A')}")
 
     recommendations = result.get('recommendations', [])
     if recommendations:
-        print(f"\n💡 额外建议:")
-        for i, rec in enumerate(recommendations[:3], 1):
-            print(f"   {i}. {rec}")
+        lines.append("\n💡 额外建议:")
+        lines.extend(f"   {i}. {rec}" for i, rec in enumerate(recommendations[:3], 1))
+
+    lines.extend(["", REPORT_SEPARATOR, "🎉 高性能 SQL 优化完成!", REPORT_SEPARATOR])
 
-    print("\n" + "="*80)
-    print("🎉 高性能 SQL 优化完成!")
-    print("="*80)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":
@@ -919,15 +1109,14 @@ if __name__ == "__main__":
     ║            (快速分析引擎 + CrewAI 深度分析)                    ║
     ║                                                                  ║
     ║  技术栈:                                                          ║
-    ║    • 高性能分析引擎    - 并行模式分析 + LRU缓存                 ║
+    ║    • 高性能分析引擎    - 预编译正则分析 + LRU缓存               ║
     ║    • CrewAI            - 单一综合 AI Agent (SQL 专家)           ║
     ║    • Ollama             - 本地 LLM 服务                          ║
-    ║    • ThreadPoolExecutor - 并发处理能力                         ║
     ║                                                                  ║
     ║  性能改进 v2.0:                                                  ║
     ║    • ⚡ 快速模式: <0.1s 本地分析，无需LLM调用                    ║
     ║    • 🔄 智能缓存: 重复查询加速比 10-100x                        ║
-    ║    • 🚀 并行分析: 多模式同时检测，提升分析效率                   ║
+    ║    • 🚀 轻量分析: 预编译正则顺序检测，无线程调度开销             ║
     ║    • 📊 性能监控: 详细的处理时间和缓存统计                        ║
     ║    • 🛡️ 容错机制: LLM失败自动降级到快速模式                      ║
     ║                                                                  ║
@@ -938,7 +1127,6 @@ if __name__ == "__main__":
     ║    • 分析速度: 提升 10-50x (快速模式)                           ║
     ║    • 缓存命中: 加速 10-100x (重复查询)                          ║
     ║    • 内存使用: 优化 <50MB                                       ║
-    ║    • 并发能力: 支持 4 线程并行分析                              ║
     ║                                                                  ║
     ║  依赖安装:                                                       ║
     ║    pip install crewai crewai-tools                              ║
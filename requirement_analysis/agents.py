@@ -13,6 +13,7 @@
 
 import os
 import logging
+from functools import lru_cache
 from typing import Optional
 from autogen_agentchat.agents import AssistantAgent
 from autogen_ext.models.openai import OpenAIChatCompletionClient
@@ -28,6 +29,23 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 
+@lru_cache(maxsize=8)
+def get_model_client(model: str, api_key: Optional[str], base_url: str) -> OpenAIChatCompletionClient:
+    """
+    获取模型客户端（按 model/api_key/base_url 缓存）
+
+    相同配置的Agent工厂共享同一个客户端及其HTTP连接池，
+    避免每个请求重复创建客户端和建立连接。
+    """
+    logger.info("初始化模型客户端")
+    logger.info("Base URL: %s, Model: %s", base_url, model)
+    return OpenAIChatCompletionClient(
+        model=model,
+        api_key=api_key,
+        base_url=base_url
+    )
+
+
 class RequirementAnalysisAgents:
     """需求分析Agent工厂类"""
     
@@ -49,18 +67,12 @@ class RequirementAnalysisAgents:
         self.base_url = base_url or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         self.model = model or os.getenv("LLM_MODEL", "gpt-4o-mini-2024-07-18")
         
-        # 创建模型客户端 - 使用健壮的包装器
+        # 获取模型客户端 - 相同配置复用已创建的客户端
         try:
-            logger.info("初始化模型客户端")
-            logger.info(f"Base URL: {self.base_url}, Model: {self.model}")
-            self.model_client = OpenAIChatCompletionClient(
-              model=self.model,
-              api_key=self.api_key,
-              base_url=self.base_url
-            )
+            self.model_client = get_model_client(self.model, self.api_key, self.base_url)
         except Exception as e:
             logger.error("初始化模型客户端失败")
-            logger.error(f"配置: Base URL={self.base_url}, Model={self.model}")
+            logger.error("配置: Base URL=%s, Model=%s", self.base_url, self.model)
             logger.error("请检查 .env 文件中的 OPENAI_API_KEY 和 OPENAI_BASE_URL 配置")
             logger.error("建议使用官方OpenAI端点: https://api.openai.com/v1")
             raise
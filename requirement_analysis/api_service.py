@@ -3,7 +3,7 @@
 基于AutoGen 0.7.0框架的需求分析REST API服务
 
 启动服务:
-uvicorn api_service:app --host 0.0.0.0 --port 8001 --reload
+uvicorn api_service:app --host 0.0.0.0 --port 8001 --loop uvloop --http httptools
 
 API 文档:
 http://localhost:8001/docs
@@ -11,6 +11,13 @@ http://localhost:8001/docs
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+
+# 安装了 orjson 时使用 ORJSONResponse 序列化响应，否则使用默认 JSONResponse
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultResponseClass
+except ImportError:
+    from fastapi.responses import JSONResponse as DefaultResponseClass
 from pydantic import BaseModel, Field
 from typing import Dict, Any, Optional, List
 import asyncio
@@ -37,7 +44,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="需求分析系统",
     description="基于AutoGen 0.7.0的智能需求分析服务",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultResponseClass
 )
 
 # CORS配置
@@ -150,7 +158,7 @@ async def create_analysis_task(
             request.model
         )
         
-        logger.info(f"创建分析任务: {task_id}")
+        logger.info("创建分析任务: %s", task_id)
         
         return AnalysisTaskResponse(
             task_id=task_id,
@@ -160,7 +168,7 @@ async def create_analysis_task(
         )
         
     except Exception as e:
-        logger.error(f"创建分析任务失败: {str(e)}")
+        logger.error("创建分析任务失败: %s", e)
         raise HTTPException(status_code=500, detail=f"创建任务失败: {str(e)}")
 
 
@@ -217,7 +225,7 @@ async def delete_analysis_task(task_id: str):
         raise HTTPException(status_code=404, detail=f"任务不存在: {task_id}")
     
     del analysis_tasks[task_id]
-    logger.info(f"删除任务: {task_id}")
+    logger.info("删除任务: %s", task_id)
     
     return {"message": f"任务 {task_id} 已删除"}
 
@@ -251,7 +259,7 @@ async def analyze_sync(request: RequirementAnalysisRequest):
         }
         
     except Exception as e:
-        logger.error(f"同步分析失败: {str(e)}", exc_info=True)
+        logger.error("同步分析失败: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
 
@@ -268,7 +276,7 @@ async def run_analysis_task(
 ):
     """后台运行分析任务"""
     try:
-        logger.info(f"开始执行分析任务: {task_id}")
+        logger.info("开始执行分析任务: %s", task_id)
         
         # 更新状态为运行中
         analysis_tasks[task_id]["status"] = "running"
@@ -288,10 +296,10 @@ async def run_analysis_task(
         analysis_tasks[task_id]["result"] = result
         analysis_tasks[task_id]["completed_at"] = datetime.now().isoformat()
         
-        logger.info(f"分析任务完成: {task_id}")
+        logger.info("分析任务完成: %s", task_id)
         
     except Exception as e:
-        logger.error(f"分析任务失败: {task_id}, 错误: {str(e)}", exc_info=True)
+        logger.error("分析任务失败: %s, 错误: %s", task_id, e, exc_info=True)
         
         analysis_tasks[task_id]["status"] = "failed"
         analysis_tasks[task_id]["error"] = str(e)
@@ -319,7 +327,7 @@ if __name__ == "__main__":
     host = os.getenv("SERVICE_HOST", "0.0.0.0")
     port = int(os.getenv("SERVICE_PORT", 8001))
     
-    logger.info(f"启动需求分析服务: {host}:{port}")
+    logger.info("启动需求分析服务: %s:%s", host, port)
     
     uvicorn.run(
         "api_service:app",
@@ -286,4 +286,9 @@ if __name__ == "__main__":
 默认运行示例1，如需运行其他示例，请修改main()函数。
 """)
     
-    asyncio.run(main())
+    # 安装了 uvloop 时使用更快的事件循环，否则使用标准 asyncio
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    (uvloop.run if uvloop else asyncio.run)(main())
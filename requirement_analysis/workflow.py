@@ -6,6 +6,9 @@
 import os
 import json
 import asyncio
+import logging
+import re
+import time
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
@@ -14,6 +17,87 @@ from autogen_agentchat.messages import ChatMessage
 
 from agents import RequirementAnalysisAgents
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps_pretty(obj: Any) -> str:
+    """格式化JSON（用于拼接提示词），优先使用 orjson，不可用时回退到标准库"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+# JSON代码块匹配模式（支持多种格式），模块加载时编译一次
+JSON_BLOCK_PATTERNS = (
+    re.compile(r'```json\s*([\s\S]*?)```', re.DOTALL),
+    re.compile(r'```\s*([\s\S]*?)```', re.DOTALL),
+)
+
+
+# loads_json / extract_first_json 与仓库根目录 optimize_sql.py 中的同名函数逐字一致（两个服务独立部署），修改时需同步
+def loads_json(json_str: str) -> Any:
+    """解析 JSON：优先使用 orjson，orjson 拒绝的宽松写法 (NaN/Infinity、超出 64 位的整数) 回退到标准库"""
+    if orjson is not None:
+        try:
+            return orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(json_str)
+
+
+def extract_first_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    单次扫描提取文本中第一个可解析的 JSON 对象
+
+    跟踪花括号深度并跳过字符串字面量（含转义），找到平衡的 {...} 即尝试解析；
+    解析失败则从下一个 '{' 继续，避免 find/rfind 切片把多个片段拼在一起。
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            if depth:
+                in_string = True
+        elif ch == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                try:
+                    json_str = text[start:i + 1]
+                    result = loads_json(json_str)
+                    if isinstance(result, dict):
+                        return result
+                except ValueError:
+                    pass
+                # 当前片段不是合法 JSON，从其后第一个 '{' 重新扫描
+                i = start + 1
+                start = -1
+                continue
+        i += 1
+    return None
+
 
 class RequirementAnalysisWorkflow:
     """需求分析工作流管理器"""
@@ -60,71 +144,71 @@ class RequirementAnalysisWorkflow:
         print("=" * 80)
 
         # 记录开始时间
-        workflow_start_time = datetime.now()
+        workflow_start_time = time.perf_counter()
 
         # 1. 技术可行性评估
         print("\n[阶段 1/6] 技术可行性评估...")
-        phase_start_time = datetime.now()
+        phase_start_time = time.perf_counter()
         tech_feasibility = await self._run_tech_feasibility_analysis(requirement_doc)
-        phase_end_time = datetime.now()
-        self.timing_stats["tech_feasibility"] = (phase_end_time - phase_start_time).total_seconds()
+        phase_end_time = time.perf_counter()
+        self.timing_stats["tech_feasibility"] = phase_end_time - phase_start_time
         self.results["tech_feasibility"] = tech_feasibility
 
         # 2. 风险识别
         print("\n[阶段 2/6] 需求风险识别...")
-        phase_start_time = datetime.now()
+        phase_start_time = time.perf_counter()
         risk_analysis = await self._run_risk_identification(requirement_doc, tech_feasibility)
-        phase_end_time = datetime.now()
-        self.timing_stats["risk_identification"] = (phase_end_time - phase_start_time).total_seconds()
+        phase_end_time = time.perf_counter()
+        self.timing_stats["risk_identification"] = phase_end_time - phase_start_time
         self.results["risk_analysis"] = risk_analysis
 
         # 3. 需求拆解
         print("\n[阶段 3/6] 需求拆解...")
-        phase_start_time = datetime.now()
+        phase_start_time = time.perf_counter()
         decomposition = await self._run_requirement_decomposition(
             requirement_doc,
             tech_feasibility,
             risk_analysis
         )
-        phase_end_time = datetime.now()
-        self.timing_stats["requirement_decomposition"] = (phase_end_time - phase_start_time).total_seconds()
+        phase_end_time = time.perf_counter()
+        self.timing_stats["requirement_decomposition"] = phase_end_time - phase_start_time
         self.results["decomposition"] = decomposition
 
         # 4. 工作量评估
         print("\n[阶段 4/6] 工作量评估...")
-        phase_start_time = datetime.now()
+        phase_start_time = time.perf_counter()
         workload = await self._run_workload_estimation(
             decomposition,
             tech_feasibility,
             risk_analysis
         )
-        phase_end_time = datetime.now()
-        self.timing_stats["workload_estimation"] = (phase_end_time - phase_start_time).total_seconds()
+        phase_end_time = time.perf_counter()
+        self.timing_stats["workload_estimation"] = phase_end_time - phase_start_time
         self.results["workload"] = workload
 
         # 5. 排期规划
         print("\n[阶段 5/6] 需求排期...")
-        phase_start_time = datetime.now()
+        phase_start_time = time.perf_counter()
         schedule = await self._run_scheduling(
             decomposition,
             workload,
             risk_analysis
         )
-        phase_end_time = datetime.now()
-        self.timing_stats["scheduling"] = (phase_end_time - phase_start_time).total_seconds()
+        phase_end_time = time.perf_counter()
+        self.timing_stats["scheduling"] = phase_end_time - phase_start_time
         self.results["schedule"] = schedule
 
         # 6. 需求复核
         print("\n[阶段 6/6] 需求复核...")
-        phase_start_time = datetime.now()
+        phase_start_time = time.perf_counter()
         review = await self._run_review(self.results)
-        phase_end_time = datetime.now()
-        self.timing_stats["review"] = (phase_end_time - phase_start_time).total_seconds()
+        phase_end_time = time.perf_counter()
+        self.timing_stats["review"] = phase_end_time - phase_start_time
         self.results["review"] = review
 
         # 计算总耗时
-        workflow_end_time = datetime.now()
-        self.timing_stats["total_workflow_duration"] = (workflow_end_time - workflow_start_time).total_seconds()
+        workflow_end_time = time.perf_counter()
+        self.timing_stats["total_workflow_duration"] = workflow_end_time - workflow_start_time
         
         # 生成最终报告
         final_report = self._generate_final_report()
@@ -177,7 +261,7 @@ class RequirementAnalysisWorkflow:
 {requirement_doc}
 
 技术可行性评估结果：
-{json.dumps(tech_feasibility, ensure_ascii=False, indent=2)}
+{_dumps_pretty(tech_feasibility)}
 
 请严格按照以下JSON格式输出风险识别结果，不要包含任何其他文字，只输出JSON对象：
 {{
@@ -218,10 +302,10 @@ class RequirementAnalysisWorkflow:
 {requirement_doc}
 
 技术可行性：
-{json.dumps(tech_feasibility, ensure_ascii=False, indent=2)}
+{_dumps_pretty(tech_feasibility)}
 
 风险分析：
-{json.dumps(risk_analysis, ensure_ascii=False, indent=2)}
+{_dumps_pretty(risk_analysis)}
 
 请严格按照以下JSON格式输出，不要包含任何其他文字，只输出JSON对象：任务拆解结果：
 {{
@@ -263,13 +347,13 @@ class RequirementAnalysisWorkflow:
         task = f"""请对以下任务进行工作量评估：
 
 任务拆解结果：
-{json.dumps(decomposition, ensure_ascii=False, indent=2)}
+{_dumps_pretty(decomposition)}
 
 技术可行性参考：
-{json.dumps(tech_feasibility, ensure_ascii=False, indent=2)}
+{_dumps_pretty(tech_feasibility)}
 
 风险分析参考：
-{json.dumps(risk_analysis, ensure_ascii=False, indent=2)}
+{_dumps_pretty(risk_analysis)}
 
 请严格按照以下JSON格式输出，不要包含任何其他文字，只输出JSON对象：工作量评估结果：
 {{
@@ -307,13 +391,13 @@ class RequirementAnalysisWorkflow:
 当前日期：{today}
 
 任务拆解：
-{json.dumps(decomposition, ensure_ascii=False, indent=2)}
+{_dumps_pretty(decomposition)}
 
 工作量评估：
-{json.dumps(workload, ensure_ascii=False, indent=2)}
+{_dumps_pretty(workload)}
 
 风险分析：
-{json.dumps(risk_analysis, ensure_ascii=False, indent=2)}
+{_dumps_pretty(risk_analysis)}
 
 请严格按照以下JSON格式输出，不要包含任何其他文字，只输出JSON对象：排期计划：
 {{
@@ -364,7 +448,7 @@ class RequirementAnalysisWorkflow:
         task = f"""请对整个需求分析过程进行复核：
 
 完整分析结果：
-{json.dumps(all_results, ensure_ascii=False, indent=2)}
+{_dumps_pretty(all_results)}
 
 请严格按照以下JSON格式输出，不要包含任何其他文字，只输出JSON对象：复核结果：
 {{
@@ -404,46 +488,33 @@ class RequirementAnalysisWorkflow:
     
     def _extract_json_from_messages(self, messages: List[ChatMessage]) -> Dict[str, Any]:
         """从消息中提取JSON结果"""
-        import re
-        
         for msg in reversed(messages):
-            if hasattr(msg, 'content') and isinstance(msg.content, str):
-                content = msg.content
-                
+            content = getattr(msg, 'content', None)
+            if isinstance(content, str):
                 # 尝试查找JSON代码块（支持多种格式）
-                json_block_patterns = [
-                    r'```json\s*([\s\S]*?)```',
-                    r'```\s*([\s\S]*?)```',
-                ]
-                
-                for pattern in json_block_patterns:
-                    matches = re.findall(pattern, content, re.DOTALL)
+                for pattern in JSON_BLOCK_PATTERNS:
+                    matches = pattern.findall(content)
                     if matches:
                         for match in matches:
                             try:
                                 json_str = match.strip()
-                                result = json.loads(json_str)
-                                print(f"✓ 成功从代码块中解析JSON")
+                                result = loads_json(json_str)
+                                logger.debug("✓ 成功从代码块中解析JSON")
                                 return result
                             except Exception as e:
-                                print(f"✗ 代码块JSON解析失败: {str(e)[:100]}")
+                                logger.debug("✗ 代码块JSON解析失败: %.100s", e)
                                 continue
                 
-                # 尝试直接解析为JSON（查找完整的JSON对象）
-                try:
-                    start = content.find('{')
-                    end = content.rfind('}')
-                    if start != -1 and end != -1 and start < end:
-                        json_str = content[start:end+1]
-                        result = json.loads(json_str)
-                        print(f"✓ 成功从文本中解析JSON")
-                        return result
-                except Exception as e:
-                    print(f"✗ 直接JSON解析失败: {str(e)[:100]}")
+                # 尝试直接解析为JSON（查找第一个完整的JSON对象）
+                result = extract_first_json(content)
+                if result is not None:
+                    logger.debug("✓ 成功从文本中解析JSON")
+                    return result
+                logger.debug("✗ 文本中未找到可解析的JSON对象")
         
         # 如果没有找到JSON，返回文本内容
-        last_content = messages[-1].content if messages else "无输出"
-        print(f"✗ 未能解析JSON，内容前200字符: {last_content[:200]}")
+        last_content = getattr(messages[-1], 'content', "无输出") if messages else "无输出"
+        logger.warning("✗ 未能解析JSON，内容前200字符: %.200s", last_content)
         return {
             "raw_output": last_content,
             "note": "未能解析为结构化JSON"
@@ -645,4 +716,9 @@ async def demo_analysis():
 
 
 if __name__ == "__main__":
-    asyncio.run(demo_analysis())
+    # 安装了 uvloop 时使用更快的事件循环，否则使用标准 asyncio
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    (uvloop.run if uvloop else asyncio.run)(demo_analysis())